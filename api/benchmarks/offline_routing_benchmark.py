@@ -0,0 +1,139 @@
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+from utils.route_cache_utils import route_cache
+from utils.distance_utils import calculate_route, set_routing_backend
+from utils.offline_routing_utils import calculate_offline_route, haversine_distance
+
+# Compares the offline routing engine against recorded OSRM answers.
+#
+# Record answers from the configured OSRM server (OSRM_BASE), then benchmark:
+#   python -m benchmarks.offline_routing_benchmark record osrm_answers.json --samples 500
+#   python -m benchmarks.offline_routing_benchmark compare osrm_answers.json
+#
+# The recording is a JSON list of
+#   {"start": [lat, lon], "end": [lat, lon], "profile": "bike", "distance": meters, "duration": minutes, "latency_ms": ms}
+
+
+# Returns the value at the given percentile (0-100) of a list of numbers
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+# Picks a random coordinate inside the bounding box (min_lat, min_lon, max_lat, max_lon)
+def random_point(bbox):
+    return (random.uniform(bbox[0], bbox[2]), random.uniform(bbox[1], bbox[3]))
+
+# Queries OSRM for random pairs inside the bounding box and records the answers with their latency
+def record(path, samples, bbox, max_distance):
+    set_routing_backend('osrm')
+    route_cache.path = ''
+    answers = []
+
+    while len(answers) < samples:
+        start, end = random_point(bbox), random_point(bbox)
+        if haversine_distance(start, end) > max_distance:
+            continue
+        profile = random.choice(['bike', 'car'])
+
+        route_cache.clear()
+        started = time.perf_counter()
+        try:
+            distance, duration = calculate_route(start, end, profile)
+        except Exception as e:
+            print(f"Skipping pair: {e}")
+            continue
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        answers.append({
+            "start": list(start),
+            "end": list(end),
+            "profile": profile,
+            "distance": distance,
+            "duration": duration,
+            "latency_ms": latency_ms,
+        })
+
+    with open(path, "w") as f:
+        json.dump(answers, f, indent=2)
+    print(f"Recorded {len(answers)} OSRM answers to {path}")
+
+# Prints error and latency statistics of the offline engine against the recorded answers, per profile
+def compare(path):
+    with open(path) as f:
+        answers = json.load(f)
+
+    for profile in ['bike', 'car']:
+        recorded = [answer for answer in answers if answer["profile"] == profile]
+        if not recorded:
+            continue
+
+        distance_errors = []
+        duration_errors = []
+        detour_ratios = []
+        speeds_kmh = []
+        offline_latencies_us = []
+
+        for answer in recorded:
+            start, end = tuple(answer["start"]), tuple(answer["end"])
+
+            started = time.perf_counter()
+            distance, duration = calculate_offline_route(start, end, profile)
+            offline_latencies_us.append((time.perf_counter() - started) * 1_000_000)
+
+            if answer["distance"] > 0:
+                distance_errors.append(abs(distance - answer["distance"]) / answer["distance"] * 100)
+                straight_line = haversine_distance(start, end)
+                if straight_line > 0:
+                    detour_ratios.append(answer["distance"] / straight_line)
+            if answer["duration"] > 0:
+                duration_errors.append(abs(duration - answer["duration"]) / answer["duration"] * 100)
+                speeds_kmh.append(answer["distance"] / 1000 / (answer["duration"] / 60))
+
+        osrm_latencies_ms = [answer["latency_ms"] for answer in recorded if "latency_ms" in answer]
+
+        print(f"Profile: {profile} ({len(recorded)} routes)")
+        print(f"  Distance error %: mean {statistics.mean(distance_errors):.1f}, p50 {percentile(distance_errors, 50):.1f}, p95 {percentile(distance_errors, 95):.1f}")
+        print(f"  Duration error %: mean {statistics.mean(duration_errors):.1f}, p50 {percentile(duration_errors, 50):.1f}, p95 {percentile(duration_errors, 95):.1f}")
+        print(f"  Offline latency us: p50 {percentile(offline_latencies_us, 50):.1f}, p99 {percentile(offline_latencies_us, 99):.1f}")
+        if osrm_latencies_ms:
+            print(f"  OSRM latency ms: p50 {percentile(osrm_latencies_ms, 50):.1f}, p99 {percentile(osrm_latencies_ms, 99):.1f}")
+        if detour_ratios and speeds_kmh:
+            print(f"  Suggested OFFLINE_DETOUR_FACTOR_{profile.upper()}={statistics.median(detour_ratios):.2f}")
+            print(f"  Suggested OFFLINE_SPEED_{profile.upper()}_KMH={statistics.median(speeds_kmh):.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline routing engine accuracy and latency benchmark")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="Record answers from the OSRM server")
+    record_parser.add_argument("path")
+    record_parser.add_argument("--samples", type=int, default=200)
+    record_parser.add_argument(
+        "--bbox",
+        type=float,
+        nargs=4,
+        default=[43.82, 18.30, 43.88, 18.45],
+        metavar=("MIN_LAT", "MIN_LON", "MAX_LAT", "MAX_LON"),
+    )
+    record_parser.add_argument("--max-distance", type=float, default=15000)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare the offline engine against a recording")
+    compare_parser.add_argument("path")
+
+    args = parser.parse_args(argv)
+    if args.command == "record":
+        record(args.path, args.samples, args.bbox, args.max_distance)
+    else:
+        compare(args.path)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
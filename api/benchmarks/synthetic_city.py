@@ -0,0 +1,189 @@
+import json
+import random
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from models.models import (
+    User,
+    Restaurant,
+    Item,
+    ItemCategory,
+    Courier,
+    CourierStatus,
+    VehicleType,
+    Order,
+    OrderItem,
+    OrderStatus,
+    OrderQueue,
+    OrderQueueStatusEnum,
+    PaymentMethod,
+    WalletNote,
+    OrderCashNote,
+)
+from utils.change_utils import parse_notes
+from crud.order_attributes_crud import compute_order_attributes
+
+# Center of the synthetic city (Sarajevo) and how far restaurants and deliveries spread around it, in degrees
+CITY_CENTER = (43.8563, 18.4131)
+CITY_SPREAD = 0.05
+
+WALLET_DENOMINATIONS = ["20BAM", "10BAM", "5BAM", "2BAM", "1BAM", "0.50BAM", "0.20BAM", "0.10BAM"]
+
+# Default shape of the synthetic city; every option can be overridden when seeding
+DEFAULT_CITY = {
+    "restaurants": 10,
+    "couriers_per_restaurant": 5,
+    "orders": 200,
+    "car_ratio": 0.3,
+    "halal_ratio": 0.2,
+    "empty_wallet_ratio": 0.1,
+    "cash_ratio": 0.5,
+    "alcohol_ratio": 0.15,
+    "heavy_ratio": 0.1,
+    "seed": 42,
+}
+
+
+def _random_point(rng):
+    return (
+        CITY_CENTER[0] + rng.uniform(-CITY_SPREAD, CITY_SPREAD),
+        CITY_CENTER[1] + rng.uniform(-CITY_SPREAD, CITY_SPREAD),
+    )
+
+# Seeds restaurants with menus, online couriers (bike/car, halal mode, wallets) and pending queued orders
+# (cash/card, alcohol, heavy items). Returns the ids of the seeded rows.
+def seed_city(db: Session, **options):
+    config = {**DEFAULT_CITY, **options}
+    rng = random.Random(config["seed"])
+    tag = f"{config['seed']}-{rng.randrange(10**9)}"
+
+    owners = [
+        User(username=f"owner-{tag}-{i}", email=f"owner-{tag}-{i}@example.com", hashed_password="-", role="owner")
+        for i in range(config["restaurants"])
+    ]
+    customers = [
+        User(username=f"customer-{tag}-{i}", email=f"customer-{tag}-{i}@example.com", hashed_password="-", role="customer")
+        for i in range(max(config["orders"] // 4, 1))
+    ]
+    courier_users = [
+        User(username=f"courier-{tag}-{i}", email=f"courier-{tag}-{i}@example.com", hashed_password="-", role="courier")
+        for i in range(config["restaurants"] * config["couriers_per_restaurant"])
+    ]
+    db.add_all(owners + customers + courier_users)
+    db.flush()
+
+    restaurants = []
+    for index, owner in enumerate(owners):
+        latitude, longitude = _random_point(rng)
+        restaurants.append(Restaurant(
+            name=f"Restaurant {tag}-{index}",
+            address=f"Street {index}",
+            city="Sarajevo",
+            latitude=latitude,
+            longitude=longitude,
+            category="Fast food",
+            contact="000-000",
+            owner_id=owner.id,
+        ))
+    db.add_all(restaurants)
+    db.flush()
+
+    menus = {}
+    items = []
+    for restaurant in restaurants:
+        menu = {
+            "light": Item(name="Burger", price=8.5, weight=400, preparation_time=15, restaurant_id=restaurant.id, category=ItemCategory.food),
+            "heavy": Item(name="Party platter", price=45, weight=7000, preparation_time=30, restaurant_id=restaurant.id, category=ItemCategory.food),
+            "drink": Item(name="Juice", price=2.5, weight=300, preparation_time=1, restaurant_id=restaurant.id, category=ItemCategory.drink),
+            "alcohol": Item(name="Beer", price=3.5, weight=500, preparation_time=1, restaurant_id=restaurant.id, category=ItemCategory.alcohol),
+        }
+        menus[restaurant.id] = menu
+        items.extend(menu.values())
+    db.add_all(items)
+    db.flush()
+
+    couriers = []
+    for index, user in enumerate(courier_users):
+        wallet = None
+        if rng.random() >= config["empty_wallet_ratio"]:
+            wallet = json.dumps({denomination: rng.randint(0, 5) for denomination in WALLET_DENOMINATIONS})
+        couriers.append(Courier(
+            user_id=user.id,
+            vehicle_type=VehicleType.car if rng.random() < config["car_ratio"] else VehicleType.bike,
+            halal_mode=rng.random() < config["halal_ratio"],
+            wallet_amount=0,
+            wallet_details=wallet,
+            restaurant_id=restaurants[index // config["couriers_per_restaurant"]].id,
+            status=CourierStatus.online,
+            wallet_notes=[
+                WalletNote(denomination=cents, quantity=quantity)
+                for cents, quantity in parse_notes(wallet).items()
+            ],
+        ))
+    db.add_all(couriers)
+    db.flush()
+
+    orders = []
+    order_lines = []
+    for index in range(config["orders"]):
+        restaurant = rng.choice(restaurants)
+        menu = menus[restaurant.id]
+        lines = [(menu["light"], rng.randint(1, 3)), (menu["drink"], 1)]
+        if rng.random() < config["alcohol_ratio"]:
+            lines.append((menu["alcohol"], rng.randint(1, 4)))
+        if rng.random() < config["heavy_ratio"]:
+            lines.append((menu["heavy"], 1))
+        total_price = round(sum(item.price * quantity for item, quantity in lines), 2)
+
+        if rng.random() < config["cash_ratio"]:
+            payment_method = PaymentMethod.cash
+            note = next(value for value in (20, 50, 100, 200) if value >= total_price)
+            money = json.dumps({f"{note}BAM": 1})
+        else:
+            payment_method = PaymentMethod.card
+            money = "4111111111111111"
+
+        latitude, longitude = _random_point(rng)
+        cash_notes = parse_notes(money) if payment_method == PaymentMethod.cash else {}
+        orders.append(Order(
+            customer_id=rng.choice(customers).id,
+            restaurant_id=restaurant.id,
+            total_price=total_price,
+            status=OrderStatus.preparing,
+            delivery_address=f"Delivery street {index}",
+            delivery_latitude=latitude,
+            delivery_longitude=longitude,
+            contact="000-000",
+            payment_method=payment_method,
+            money=money,
+            **compute_order_attributes(lines),
+            cash_notes=[
+                OrderCashNote(denomination=cents, quantity=quantity)
+                for cents, quantity in cash_notes.items()
+            ],
+        ))
+        order_lines.append(lines)
+    db.add_all(orders)
+    db.flush()
+
+    queue_entries = []
+    ready_at = datetime.utcnow() + timedelta(minutes=15)
+    for order, lines in zip(orders, order_lines):
+        db.add_all([
+            OrderItem(order_id=order.id, item_id=item.id, quantity=quantity, price=item.price)
+            for item, quantity in lines
+        ])
+        queue_entries.append(OrderQueue(
+            order_id=order.id,
+            status=OrderQueueStatusEnum.pending,
+            estimated_preparation_time=ready_at,
+            weight=order.total_weight,
+        ))
+    db.add_all(queue_entries)
+    db.commit()
+
+    return {
+        "restaurant_ids": [restaurant.id for restaurant in restaurants],
+        "courier_ids": [courier.id for courier in couriers],
+        "order_ids": [order.id for order in orders],
+        "queue_ids": [entry.id for entry in queue_entries],
+    }
@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
 from models.models import Order, OrderAssignment, OrderAssignmentStatus, Courier, Restaurant, OrderStatus, CourierStatus, OperatingHours, OrderQueue, OrderQueueStatusEnum
-from sqlalchemy import func, and_, or_
+from schemas.schemas import AdminStatsSnapshot
+from sqlalchemy import func, and_, or_, select
 from datetime import datetime, timedelta
 
 # Retrieves the count of pending orders from the database
@@ -83,3 +84,83 @@ def a_get_closed_restaurants(db: Session):
     ).scalar()
 
     return closed_restaurants
+
+# Computes every admin dashboard counter with filtered aggregates (COUNT(*) FILTER (WHERE ...)) in three queries,
+# one per table group, instead of one query per counter. Counts the same rows as the a_get_* functions above.
+def a_get_admin_snapshot(db: Session) -> AdminStatsSnapshot:
+    now = datetime.now().time()
+    in_one_hour = (datetime.now() + timedelta(hours=1)).time()
+    today = datetime.now().strftime("%A")
+    tomorrow = (datetime.now() + timedelta(days=1)).strftime("%A")
+
+    in_delivery_orders = (
+        select(func.count(Order.id))
+        .join(OrderAssignment, Order.id == OrderAssignment.order_id)
+        .where(OrderAssignment.status == OrderAssignmentStatus.in_delivery)
+        .scalar_subquery()
+    )
+    queued_orders = (
+        select(OrderQueue.order_id)
+        .where(OrderQueue.status == OrderQueueStatusEnum.pending)
+        .distinct()
+        .subquery()
+    )
+    pending_orders, preparing_orders, in_delivery_orders = db.execute(
+        select(
+            func.count(Order.id).filter(Order.status == OrderStatus.pending),
+            func.count(Order.id).filter(
+                Order.status == OrderStatus.preparing,
+                queued_orders.c.order_id.isnot(None),
+            ),
+            in_delivery_orders,
+        ).select_from(Order).outerjoin(queued_orders, queued_orders.c.order_id == Order.id)
+    ).one()
+
+    online_couriers, busy_couriers, offline_couriers = db.execute(
+        select(
+            func.count(Courier.id).filter(Courier.status == CourierStatus.online),
+            func.count(Courier.id).filter(Courier.status == CourierStatus.busy),
+            func.count(Courier.id).filter(Courier.status == CourierStatus.offline),
+        )
+    ).one()
+
+    open_restaurants, closing_soon_restaurants, closed_restaurants = db.execute(
+        select(
+            func.count(Restaurant.id).filter(
+                OperatingHours.day_of_week == today,
+                OperatingHours.opening_time <= now,
+                OperatingHours.closing_time > now,
+                OperatingHours.closing_time > in_one_hour,
+            ),
+            func.count(Restaurant.id).filter(
+                OperatingHours.day_of_week == today,
+                OperatingHours.closing_time <= in_one_hour,
+                OperatingHours.closing_time > now,
+            ),
+            func.count(Restaurant.id).filter(
+                or_(
+                    and_(OperatingHours.day_of_week == today, OperatingHours.opening_time > now),
+                    and_(OperatingHours.day_of_week == today, OperatingHours.closing_time <= now),
+                    and_(OperatingHours.day_of_week == tomorrow, OperatingHours.closing_time <= now),
+                )
+            ),
+        )
+        .join(Restaurant.operating_hours)
+        .where(OperatingHours.day_of_week.in_([today, tomorrow]))
+    ).one()
+
+    return AdminStatsSnapshot(
+        pendingOrders=pending_orders,
+        preparingOrders=preparing_orders,
+        inDeliveryOrders=in_delivery_orders,
+        onlineCouriers=online_couriers,
+        busyCouriers=busy_couriers,
+        offlineCouriers=offline_couriers,
+        openRestaurants=open_restaurants,
+        closingSoonRestaurants=closing_soon_restaurants,
+        closedRestaurants=closed_restaurants,
+    )
+
+# Builds the admin dashboard snapshot pushed over /ws/admin-stats
+def a_get_admin_stats(db: Session):
+    return a_get_admin_snapshot(db).model_dump()
@@ -1,7 +1,9 @@
 import pytz
 import datetime
+from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from models.models import Chat, Conversation, User, OrderAssignment, OrderAssignmentStatus, Order, Courier
+from utils.unread_counter_utils import unread_counters
 
 # Retrieves the chat history for a specific user, including the last message in each conversation
 async def get_user_chat_history(db: Session, user_id: int):
@@ -95,19 +97,18 @@ async def create_message(db: Session, conversation_id: int, sender_id: int, rece
     
     db.add(chat_message)
     db.commit()
+    unread_counters.message_created(receiver_id)
     db.refresh(chat_message)
     return chat_message
 
-# Sends a message in a conversation and broadcasts it to any active WebSocket connections
-async def handle_send_message(db: Session, conversation_id: int, sender_id: int, receiver_id: int, message: str, connections: dict):
+# Sends a message in a conversation and broadcasts it to the conversation's WebSocket connections on every worker
+async def handle_send_message(db: Session, conversation_id: int, sender_id: int, receiver_id: int, message: str, chat_rooms):
     if not message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty")
     
     chat_message = await create_message(db, conversation_id, sender_id, receiver_id, message)
     
-    if conversation_id in connections:
-        for connection in connections[conversation_id]:
-            await connection.send_text(chat_message.message)
+    chat_rooms.publish(conversation_id, chat_message.message)
 
     return chat_message
 
@@ -118,3 +119,14 @@ async def get_conversation_messages(db: Session, conversation_id: int):
 # Retrieves the last message in a specific conversation
 async def get_last_message(db: Session, conversation_id: int):
     return db.query(Chat).filter(Chat.conversation_id == conversation_id).order_by(Chat.created_at.desc()).first()
+
+# Marks the messages a user received in a conversation as read and updates their unread count
+async def mark_conversation_read(db: Session, conversation_id: int, user_id: int):
+    read_count = db.query(Chat).filter(
+        Chat.conversation_id == conversation_id,
+        Chat.receiver_id == user_id,
+        Chat.is_seen == False
+    ).update({"is_seen": True})
+    db.commit()
+    unread_counters.messages_read(user_id, read_count)
+    return {"message": "Conversation marked as read"}
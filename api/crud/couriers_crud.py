@@ -1,7 +1,9 @@
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
-from models.models import Courier, User, Restaurant
+from models.models import Courier, User, Restaurant, WalletNote
 from schemas.schemas import CourierCreate, CourierUpdate
+from crud.money_crud import replace_wallet_notes
+from utils.change_utils import parse_notes
 
 # Searches for restaurants by name
 async def search_restaurants(db: Session, name: str):
@@ -84,6 +86,10 @@ async def update_courier(db: Session, courier_id: int, courier: CourierUpdate):
     for key, value in courier.dict(exclude_unset=True).items():
         setattr(existing_courier, key, value)
 
+    # The wallet notes table is what dispatch and deliveries read, so a directly edited wallet is mirrored into it
+    if "wallet_details" in courier.dict(exclude_unset=True):
+        replace_wallet_notes(db, existing_courier.id, parse_notes(existing_courier.wallet_details))
+
     db.commit()
     db.refresh(existing_courier)
     return existing_courier
@@ -94,6 +100,7 @@ async def delete_courier(db: Session, courier_id: int):
     if not existing_courier:
         raise HTTPException(status_code=404, detail="Courier not found")
 
+    db.query(WalletNote).filter(WalletNote.courier_id == courier_id).delete(synchronize_session=False)
     db.delete(existing_courier)
     db.commit()
     return {"message": "Courier deleted successfully"}
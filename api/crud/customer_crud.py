@@ -1,9 +1,12 @@
+import pytz
 import base64
 from fastapi import HTTPException
 from datetime import datetime
+from sqlalchemy import exists, func
 from sqlalchemy.orm import Session
 from models.models import Restaurant, Item, MenuCategory, Image, OperatingHours
 from utils.rating_utils import calculate_average_rating
+from utils.delivery_zone_index_utils import delivery_zone_index
 
 # Searches for restaurants based on a query string and returns matching restaurants with details
 async def search_restaurants(db: Session, query: str):
@@ -155,3 +158,42 @@ async def get_restaurant_menu(db: Session, restaurant_name: str):
         )
 
     return menu_data
+
+# Lists the restaurants whose delivery zones cover a location, optionally only those of a category or open right now.
+# The covering restaurants come from the in-memory zone index, so only the matching restaurants are loaded.
+async def get_restaurants_delivering_here(
+    db: Session, latitude: float, longitude: float, category: str = None, open_now: bool = False
+):
+    restaurant_ids = delivery_zone_index.restaurants_delivering_to(db, latitude, longitude)
+    if not restaurant_ids:
+        return []
+
+    query = db.query(Restaurant).filter(Restaurant.id.in_(restaurant_ids))
+    if category:
+        query = query.filter(func.lower(Restaurant.category) == category.lower())
+    if open_now:
+        local_now = datetime.now(pytz.timezone("Europe/Sarajevo"))
+        now = local_now.time().replace(tzinfo=None)
+        query = query.filter(
+            exists().where(
+                OperatingHours.restaurant_id == Restaurant.id,
+                OperatingHours.day_of_week == local_now.strftime("%A"),
+                OperatingHours.opening_time <= now,
+                OperatingHours.closing_time > now,
+            )
+        )
+
+    return [
+        {
+            "id": restaurant.id,
+            "name": restaurant.name,
+            "rating": calculate_average_rating(restaurant.total_rating, restaurant.rating_count),
+            "address": restaurant.address,
+            "city": restaurant.city,
+            "category": restaurant.category,
+            "contact": restaurant.contact,
+            "latitude": restaurant.latitude,
+            "longitude": restaurant.longitude,
+        }
+        for restaurant in query.order_by(Restaurant.name).all()
+    ]
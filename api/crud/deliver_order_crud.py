@@ -1,4 +1,3 @@
-import json
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from models.models import (
@@ -14,6 +13,16 @@ from models.models import (
     Courier,
     CourierStatus,
 )
+from crud.money_crud import (
+    get_wallet_notes,
+    add_wallet_notes,
+    remove_wallet_notes,
+    get_order_cash_notes,
+    get_change_notes,
+)
+from utils.dispatch_queue_utils import dispatch_queue
+from utils.change_utils import format_notes
+from utils.change_index_utils import change_index
 
 # Retrieves the list of orders assigned to a specific courier for delivery, including order and customer details
 async def get_orders_for_courier(db: Session, user_id: int):
@@ -122,42 +131,27 @@ async def finish_order(db: Session, order_id: int):
         print(
             f"Payment method is cash for order ID {order_id}. Updating courier wallet."
         )
-        money_data = json.loads(order.money)
-        wallet = json.loads(courier.wallet_details)
-
-        for denomination, quantity in money_data.items():
-            print(f"Adding {quantity} of {denomination}BAM to courier wallet.")
-            wallet[denomination] = wallet.get(denomination, 0) + quantity
-
-        if assignment.optimal_change:
-            optimal_change = json.loads(assignment.optimal_change)
-            print(f"Optimal change: {optimal_change}")
-            for change in optimal_change:
-                denomination, qty = change.split(" x ")
-                qty = int(qty)
-                denomination_key = f"{denomination}"
-                print(
-                    f"Removing {qty} of {denomination_key} from courier wallet as change."
-                )
-
-                if wallet.get(denomination_key, 0) >= qty:
-                    if wallet[denomination_key] == qty:
-                        print(f"Removing all {denomination_key} from courier wallet.")
-                        del wallet[denomination_key]
-                    else:
-                        wallet[denomination_key] -= qty
-                        print(
-                            f"Updated {denomination_key} in courier wallet, new quantity: {wallet[denomination_key]}"
-                        )
-                else:
-                    print(
-                        f"Not enough {denomination_key} in wallet to return as change. Current quantity: {wallet.get(denomination_key, 0)}"
-                    )
-
-        print(f"Final courier wallet state before saving: {wallet}")
-
-        courier.wallet_details = json.dumps(wallet)
-        print(f"Courier wallet updated successfully for courier ID {courier.id}.")
+        paid_notes = get_order_cash_notes(db, [order.id]).get(order.id, {})
+        change_notes = get_change_notes(db, assignment.id)
+        print(f"Adding {paid_notes} and removing change {change_notes} (cents) in courier wallet.")
+
+        # Atomic SQL increments and conditional decrements, so concurrent wallet updates cannot overwrite each other
+        add_wallet_notes(db, courier.id, paid_notes)
+        removed_notes = remove_wallet_notes(db, courier.id, change_notes)
+
+        wallet = get_wallet_notes(db, [courier.id]).get(courier.id, {})
+        courier.wallet_details = format_notes(wallet)
+        print(f"Courier wallet updated successfully for courier ID {courier.id}: {courier.wallet_details}")
+
+        # Keep the courier's change index in step: added notes extend it, removed change forces a rebuild
+        if removed_notes:
+            change_index.rebuild(courier.id, wallet)
+        else:
+            previous_wallet = {
+                cents: quantity - paid_notes.get(cents, 0)
+                for cents, quantity in wallet.items()
+            }
+            change_index.add_notes(courier.id, previous_wallet, wallet, paid_notes)
 
     order.status = OrderStatus.delivered
     assignment.status = OrderAssignmentStatus.delivered
@@ -169,4 +163,6 @@ async def finish_order(db: Session, order_id: int):
         f"Order ID {order_id} marked as delivered and courier ID {courier.id} set to online."
     )
 
+    dispatch_queue.notify(f"courier {courier.id} online")
+
     return {"message": "Order successfully finished"}
@@ -1,14 +1,14 @@
 from sqlalchemy.orm import Session
-from models.models import DeliveryZone, Restaurant
+from fastapi import HTTPException
+from models.models import DeliveryZone, RestaurantDeliveryZone
 from schemas.schemas import DeliveryZoneCreate, DeliveryZoneUpdate
+from utils.delivery_zone_index_utils import delivery_zone_index
 
-# Sets the delivery_zone_id of all restaurants in the specified zone to None (removes the association with the zone)
-def nullify_restaurant_zones(db: Session, zone_id: int):
-    restaurants = db.query(Restaurant).filter(Restaurant.delivery_zone_id == zone_id).all()
-    for restaurant in restaurants:
-        restaurant.delivery_zone_id = None
-    
-    db.commit()
+# Removes the links between restaurants and the specified zone (restaurants no longer deliver there)
+def unlink_restaurant_zones(db: Session, zone_id: int):
+    db.query(RestaurantDeliveryZone).filter(
+        RestaurantDeliveryZone.delivery_zone_id == zone_id
+    ).delete(synchronize_session=False)
 
 # Retrieves all delivery zones from the database
 async def get_all_zones(db: Session):
@@ -20,6 +20,7 @@ async def create_zone(db: Session, zone: DeliveryZoneCreate):
     db.add(db_zone)
     db.commit()
     db.refresh(db_zone)
+    delivery_zone_index.invalidate()
     return db_zone
 
 # Updates an existing delivery zone with the provided data
@@ -31,17 +32,19 @@ async def update_zone(db: Session, zone_id: int, zone: DeliveryZoneUpdate):
         setattr(db_zone, key, value)
     db.commit()
     db.refresh(db_zone)
+    delivery_zone_index.invalidate()
     return db_zone
 
-# Deletes a delivery zone by ID, and nullifies the delivery_zone_id for all associated restaurants
-def delete_delivery_zone_by_id(db: Session, zone_id: int):
+# Deletes a delivery zone by ID, and removes it from all associated restaurants
+async def delete_delivery_zone_by_id(db: Session, zone_id: int):
     zone = db.query(DeliveryZone).filter(DeliveryZone.id == zone_id).first()
     if not zone:
         raise HTTPException(status_code=404, detail="Zone not found")
-    
-    nullify_restaurant_zones(db, zone_id)
-    
+
+    unlink_restaurant_zones(db, zone_id)
+
     db.delete(zone)
     db.commit()
-    
-    return {"message": "Zone deleted successfully, and associated restaurants' delivery_zone_id set to NULL"}
+    delivery_zone_index.invalidate()
+
+    return {"message": "Zone deleted successfully, and removed from associated restaurants"}
@@ -0,0 +1,183 @@
+from sqlalchemy import func, exists, text
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+from models.models import (
+    Courier,
+    Order,
+    OrderAssignment,
+    PaymentMethod,
+    WalletNote,
+    OrderCashNote,
+    ChangeNote,
+)
+from utils.change_utils import parse_notes, parse_change
+
+# Returns an INSERT supporting ON CONFLICT for the session's database (PostgreSQL in production, SQLite locally)
+def _insert(db: Session, model):
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+# Loads the wallet notes of the given couriers as {courier_id: {cents: quantity}}. With min_cash_on_hand (cents) the
+# database skips couriers holding less cash in total, so their wallets are never loaded.
+def get_wallet_notes(db: Session, courier_ids, min_cash_on_hand: int = 0) -> dict[int, dict[int, int]]:
+    wallets = {}
+    if not courier_ids:
+        return wallets
+
+    query = db.query(WalletNote.courier_id, WalletNote.denomination, WalletNote.quantity).filter(
+        WalletNote.courier_id.in_(courier_ids), WalletNote.quantity > 0
+    )
+    if min_cash_on_hand > 0:
+        couriers_with_cash = (
+            db.query(WalletNote.courier_id)
+            .filter(WalletNote.courier_id.in_(courier_ids))
+            .group_by(WalletNote.courier_id)
+            .having(func.sum(WalletNote.denomination * WalletNote.quantity) >= min_cash_on_hand)
+        )
+        query = query.filter(WalletNote.courier_id.in_(couriers_with_cash))
+
+    rows = query.all()
+    for courier_id, denomination, quantity in rows:
+        wallets.setdefault(courier_id, {})[denomination] = quantity
+    return wallets
+
+# Adds notes to a courier's wallet in one atomic INSERT ... ON CONFLICT DO UPDATE SET quantity = quantity + n
+def add_wallet_notes(db: Session, courier_id: int, notes: dict[int, int]):
+    if not notes:
+        return
+
+    statement = _insert(db, WalletNote).values([
+        {"courier_id": courier_id, "denomination": cents, "quantity": quantity}
+        for cents, quantity in notes.items()
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[WalletNote.courier_id, WalletNote.denomination],
+        set_={"quantity": WalletNote.quantity + statement.excluded.quantity},
+    )
+    db.execute(statement)
+
+# Removes notes from a courier's wallet with atomic conditional decrements. A denomination the wallet does not hold
+# enough of is left untouched. Returns the notes that were actually removed.
+def remove_wallet_notes(db: Session, courier_id: int, notes: dict[int, int]) -> dict[int, int]:
+    removed = {}
+    for cents, quantity in notes.items():
+        updated = (
+            db.query(WalletNote)
+            .filter(
+                WalletNote.courier_id == courier_id,
+                WalletNote.denomination == cents,
+                WalletNote.quantity >= quantity,
+            )
+            .update({WalletNote.quantity: WalletNote.quantity - quantity}, synchronize_session=False)
+        )
+        if updated:
+            removed[cents] = quantity
+        else:
+            print(f"Not enough {cents / 100:.2f}BAM in wallet of courier ID {courier_id} to return as change.")
+    return removed
+
+# Replaces all notes of a courier's wallet, used when the wallet JSON is edited directly
+def replace_wallet_notes(db: Session, courier_id: int, notes: dict[int, int]):
+    db.query(WalletNote).filter(WalletNote.courier_id == courier_id).delete(synchronize_session=False)
+    db.add_all([
+        WalletNote(courier_id=courier_id, denomination=cents, quantity=quantity)
+        for cents, quantity in notes.items()
+        if quantity > 0
+    ])
+
+# Loads the notes each cash order was paid with as {order_id: {cents: quantity}}
+def get_order_cash_notes(db: Session, order_ids) -> dict[int, dict[int, int]]:
+    payments = {}
+    if not order_ids:
+        return payments
+
+    rows = (
+        db.query(OrderCashNote.order_id, OrderCashNote.denomination, OrderCashNote.quantity)
+        .filter(OrderCashNote.order_id.in_(order_ids))
+        .all()
+    )
+    for order_id, denomination, quantity in rows:
+        payments.setdefault(order_id, {})[denomination] = quantity
+    return payments
+
+# Loads the change notes of an assignment as {cents: quantity}
+def get_change_notes(db: Session, assignment_id: int) -> dict[int, int]:
+    rows = (
+        db.query(ChangeNote.denomination, ChangeNote.quantity)
+        .filter(ChangeNote.assignment_id == assignment_id)
+        .all()
+    )
+    return dict(rows)
+
+# Advisory lock serializing the backfill when several workers start at once
+MONEY_BACKFILL_LOCK_KEY = 7301
+
+# Inserts note rows, skipping denominations another writer already inserted for the same owner
+def _insert_notes_if_missing(db: Session, model, owner_column, rows):
+    if not rows:
+        return
+    statement = _insert(db, model).values(rows).on_conflict_do_nothing(
+        index_elements=[owner_column, model.denomination],
+    )
+    db.execute(statement)
+
+# Fills the note tables from the JSON columns for rows written before the tables existed; safe to run repeatedly and
+# from several workers at once
+def backfill_money_notes(db: Session):
+    counts = {"wallets": 0, "orders": 0, "assignments": 0}
+
+    if db.get_bind().dialect.name == "postgresql":
+        # Held until the commit; a worker waiting on it then finds the notes in place and skips them
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MONEY_BACKFILL_LOCK_KEY})
+
+    couriers = (
+        db.query(Courier)
+        .filter(
+            Courier.wallet_details.isnot(None),
+            ~exists().where(WalletNote.courier_id == Courier.id),
+        )
+        .all()
+    )
+    for courier in couriers:
+        _insert_notes_if_missing(db, WalletNote, WalletNote.courier_id, [
+            {"courier_id": courier.id, "denomination": cents, "quantity": quantity}
+            for cents, quantity in parse_notes(courier.wallet_details).items()
+            if quantity > 0
+        ])
+        counts["wallets"] += 1
+
+    orders = (
+        db.query(Order)
+        .filter(
+            Order.payment_method == PaymentMethod.cash,
+            ~exists().where(OrderCashNote.order_id == Order.id),
+        )
+        .all()
+    )
+    for order in orders:
+        _insert_notes_if_missing(db, OrderCashNote, OrderCashNote.order_id, [
+            {"order_id": order.id, "denomination": cents, "quantity": quantity}
+            for cents, quantity in parse_notes(order.money).items()
+        ])
+        counts["orders"] += 1
+
+    assignments = (
+        db.query(OrderAssignment)
+        .filter(
+            OrderAssignment.optimal_change.isnot(None),
+            ~exists().where(ChangeNote.assignment_id == OrderAssignment.id),
+        )
+        .all()
+    )
+    for assignment in assignments:
+        _insert_notes_if_missing(db, ChangeNote, ChangeNote.assignment_id, [
+            {"assignment_id": assignment.id, "denomination": cents, "quantity": quantity}
+            for cents, quantity in parse_change(assignment.optimal_change).items()
+        ])
+        counts["assignments"] += 1
+
+    db.commit()
+    if any(counts.values()):
+        print(f"Backfilled money notes: {counts}")
+    return counts
@@ -2,11 +2,40 @@ import pytz
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from models.models import Notification
+from utils.notification_hub_utils import notification_hub
 
 # Retrieves all notifications for a specific user, ordered by creation date in descending order
 def get_notifications(db: Session, user_id: int):
     return db.query(Notification).filter_by(user_id=user_id).order_by(Notification.created_at.desc()).all()
 
+# Serializes a notification as sent over /ws/notifications
+def notification_to_dict(notification: Notification) -> dict:
+    return {
+        "id": notification.id,
+        "message": notification.message,
+        "read": notification.read,
+        "created_at": (
+            notification.created_at.isoformat()
+            if notification.created_at
+            else None
+        ),
+    }
+
+# Retrieves the newest notifications of a user, at most limit and only those after after_id when it is given
+def get_notification_backfill(db: Session, user_id: int, after_id: int, limit: int):
+    query = db.query(Notification).filter(Notification.user_id == user_id)
+    if after_id is not None:
+        query = query.filter(Notification.id > after_id)
+    return [
+        notification_to_dict(notification)
+        for notification in query.order_by(Notification.id.desc()).limit(limit).all()
+    ]
+
+# Publishes committed notifications (serialized before the commit expired them) to their users' sockets
+def publish_notifications(notifications):
+    for user_id, notification in notifications:
+        notification_hub.publish(user_id, notification)
+
 # Marks a specific notification as read based on the notification_id
 async def mark_as_read(db: Session, notification_id: int):
     notification = db.query(Notification).filter(Notification.id == notification_id).first()
@@ -15,6 +44,9 @@ async def mark_as_read(db: Session, notification_id: int):
         raise HTTPException(status_code=404, detail="Notification not found")
     
     notification.read = True
+    user_id = notification.user_id
+    changed = notification_to_dict(notification)
     db.commit()
+    publish_notifications([(user_id, changed)])
     
     return {"message": "Notification marked as read"}
@@ -0,0 +1,55 @@
+from sqlalchemy import func, case
+from sqlalchemy.orm import Session
+from models.models import OrderItem, Item, ItemCategory
+
+# Computes the dispatch attributes of an order from (item, quantity) pairs
+def compute_order_attributes(lines) -> dict:
+    return {
+        "contains_alcohol": any(item.category == ItemCategory.alcohol for item, _ in lines),
+        "total_weight": sum(item.weight * quantity for item, quantity in lines),
+        "max_prep_time": max((item.preparation_time for item, _ in lines), default=0),
+        "item_count": sum(quantity for _, quantity in lines),
+    }
+
+# Returns {order_id: {"contains_alcohol", "total_weight", "max_prep_time", "item_count"}} for the given orders.
+# Reads the columns stored at creation and aggregates the order items only for orders created before they existed.
+def get_order_attributes(db: Session, orders) -> dict:
+    attributes = {}
+    missing_ids = []
+
+    for order in orders:
+        if order.contains_alcohol is None or order.total_weight is None or order.max_prep_time is None:
+            missing_ids.append(order.id)
+            continue
+        attributes[order.id] = {
+            "contains_alcohol": order.contains_alcohol,
+            "total_weight": order.total_weight,
+            "max_prep_time": order.max_prep_time,
+            "item_count": order.item_count,
+        }
+
+    if missing_ids:
+        rows = (
+            db.query(
+                OrderItem.order_id,
+                func.max(case((Item.category == ItemCategory.alcohol, 1), else_=0)),
+                func.sum(Item.weight * OrderItem.quantity),
+                func.max(Item.preparation_time),
+                func.sum(OrderItem.quantity),
+            )
+            .join(Item, Item.id == OrderItem.item_id)
+            .filter(OrderItem.order_id.in_(missing_ids))
+            .group_by(OrderItem.order_id)
+            .all()
+        )
+        aggregated = {row[0]: row[1:] for row in rows}
+        for order_id in missing_ids:
+            contains_alcohol, total_weight, max_prep_time, item_count = aggregated.get(order_id, (0, 0, 0, 0))
+            attributes[order_id] = {
+                "contains_alcohol": bool(contains_alcohol),
+                "total_weight": total_weight or 0.0,
+                "max_prep_time": max_prep_time or 0,
+                "item_count": item_count or 0,
+            }
+
+    return attributes
@@ -1,22 +1,38 @@
+import os
 import pytz
 from sqlalchemy.orm import Session
-from fastapi import HTTPException
+from fastapi import HTTPException, BackgroundTasks
 from datetime import datetime
-from geopy.geocoders import Nominatim
-from models.models import Order, OrderItem, Bank, Notification, User, Restaurant
+from dotenv import load_dotenv
+from database.database import SessionLocal
+from models.models import Order, OrderItem, OrderCashNote, Item, Bank, Notification, User, Restaurant
 from schemas.schemas import OrderCreate, OrderStatusEnum
 from utils.delivery_utils import is_in_delivery_zone
+from utils.geocoding_utils import geocode_address
+from utils.offline_routing_utils import haversine_distance
 from utils.card_utils import validate_card_payment
+from utils.change_utils import parse_notes
+from crud.order_attributes_crud import compute_order_attributes
+from crud.notifications_crud import notification_to_dict, publish_notifications
+
+load_dotenv()
+
+# How far (in meters) a client-supplied pin may be from the geocoded address before the order is flagged
+LOCATION_MISMATCH_DISTANCE = float(os.getenv('LOCATION_MISMATCH_DISTANCE', 500))
 
 # Creates a new order and handles address validation, delivery zone check, and payment validation
-async def create_order(db: Session, order: OrderCreate):
-    geolocator = Nominatim(user_agent="food-express")
-    location = geolocator.geocode(order.delivery_address, country_codes="BA") # Geolocates the delivery address using Nominatim
-    if not location:
-        raise HTTPException(status_code=400, detail="Address could not be located.")
-    
-    longitude = location.longitude
-    latitude = location.latitude
+async def create_order(db: Session, order: OrderCreate, background_tasks: BackgroundTasks = None):
+    if order.latitude is not None and order.longitude is not None:
+        # Trusts the map pin for the zone check; the typed address is verified after the response is sent
+        latitude, longitude = order.latitude, order.longitude
+        location_verified = None
+    else:
+        location = await geocode_address(db, order.delivery_address) # Geolocates the delivery address (cached, rate limited)
+        if not location:
+            raise HTTPException(status_code=400, detail="Address could not be located.")
+
+        latitude, longitude = location
+        location_verified = True
 
     # Checks if the delivery address is within the restaurant's delivery zone
     if not is_in_delivery_zone(db, order.restaurant_id, latitude, longitude):
@@ -30,7 +46,20 @@ async def create_order(db: Session, order: OrderCreate):
 
     elif order.payment_method == 'cash':
         order_money = order.money
-    
+        try:
+            cash_notes = parse_notes(order.money)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cash amounts.")
+
+    # Loads the ordered items once to precompute what queueing and dispatch need
+    item_ids = {order_item.item_id for order_item in order.items}
+    items = {item.id: item for item in db.query(Item).filter(Item.id.in_(item_ids)).all()}
+    if len(items) != len(item_ids):
+        raise HTTPException(status_code=400, detail="Ordered item not found.")
+    attributes = compute_order_attributes(
+        [(items[order_item.item_id], order_item.quantity) for order_item in order.items]
+    )
+
     new_order = Order(
         customer_id=order.customer_id,
         restaurant_id=order.restaurant_id,
@@ -42,23 +71,25 @@ async def create_order(db: Session, order: OrderCreate):
         cutlery_included=order.cutlery_included,
         contact=order.contact,
         payment_method=order.payment_method,
-        money=order_money
+        money=order_money,
+        location_verified=location_verified,
+        **attributes,
     )
+    new_order.order_items = [
+        OrderItem(item_id=item.item_id, quantity=item.quantity, price=item.price)
+        for item in order.items
+    ]
+    if order.payment_method == 'cash':
+        new_order.cash_notes = [
+            OrderCashNote(denomination=cents, quantity=quantity)
+            for cents, quantity in cash_notes.items()
+        ]
+
+    # The order, its items and its cash notes are inserted in one transaction
     db.add(new_order)
     db.commit()
     db.refresh(new_order)
 
-    for item in order.items:
-        order_item = OrderItem(
-            order_id=new_order.id,
-            item_id=item.item_id,
-            quantity=item.quantity,
-            price=item.price
-        )
-        db.add(order_item)
-
-    db.commit()
-
     restaurant_owner = db.query(User).join(Restaurant).filter(Restaurant.id == order.restaurant_id).first()
 
     local_timezone = pytz.timezone("Europe/Sarajevo")
@@ -72,6 +103,56 @@ async def create_order(db: Session, order: OrderCreate):
             created_at=local_now.replace(tzinfo=None)
         )
         db.add(new_notification)
+        db.flush()
+        published = [(restaurant_owner.id, notification_to_dict(new_notification))]
         db.commit()
+        publish_notifications(published)
+
+    if location_verified is None:
+        if background_tasks is not None:
+            background_tasks.add_task(verify_order_location, new_order.id)
+        else:
+            await verify_order_location(new_order.id)
 
     return new_order
+
+# Checks a client-supplied delivery pin against the typed address. The address is geocoded (usually a cache hit)
+# and the order is flagged, and its restaurant owner notified, when the pin is too far from it.
+async def verify_order_location(order_id: int):
+    db = SessionLocal()
+    try:
+        order = db.query(Order).filter(Order.id == order_id).first()
+        if not order:
+            return
+
+        location = await geocode_address(db, order.delivery_address)
+        if location:
+            distance = haversine_distance(location, (order.delivery_latitude, order.delivery_longitude))
+            order.location_verified = distance <= LOCATION_MISMATCH_DISTANCE
+        else:
+            distance = None
+            order.location_verified = False
+
+        published = []
+        if not order.location_verified:
+            print(f"Delivery pin of order ID {order.id} does not match its address (distance: {distance}).")
+            restaurant_owner = db.query(User).join(Restaurant).filter(Restaurant.id == order.restaurant_id).first()
+            if restaurant_owner:
+                local_now = datetime.now(pytz.timezone("Europe/Sarajevo"))
+                mismatch_notification = Notification(
+                    user_id=restaurant_owner.id,
+                    message=f"The delivery location of order #{order.id} does not match the address '{order.delivery_address}'. Please confirm it with the customer at {order.contact}.",
+                    read=False,
+                    created_at=local_now.replace(tzinfo=None)
+                )
+                db.add(mismatch_notification)
+                db.flush()
+                published.append((restaurant_owner.id, notification_to_dict(mismatch_notification)))
+
+        db.commit()
+        publish_notifications(published)
+    except Exception as e:
+        db.rollback()
+        print(f"Error while verifying the location of order ID {order_id}: {e}")
+    finally:
+        db.close()
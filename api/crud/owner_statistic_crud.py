@@ -1,7 +1,7 @@
 from sqlalchemy.orm import Session
 from models.models import Order, OrderStatus, OrderQueue, OrderQueueStatusEnum, Courier, CourierStatus, Restaurant, Rating
 from utils.rating_utils import calculate_average_rating
-from sqlalchemy import func
+from sqlalchemy import func, select, case, cast, and_, Integer
 from decimal import Decimal
 
 # Returns the count of pending orders for a specific restaurant owner
@@ -72,3 +72,91 @@ def o_get_ratings_owner(db: Session, owner_id: int):
     final_average_rating = calculate_average_rating(total_average_sum, rated_restaurants)
 
     return final_average_rating
+
+# Computes the dashboard statistics of many owners in one query grouped by Restaurant.owner_id: orders and couriers
+# are first aggregated per restaurant, then summed per owner. Returns {owner_id: snapshot}, with the same values as
+# the o_get_*_owner functions above.
+def o_get_owner_stats_batch(db: Session, owner_ids) -> dict:
+    if not owner_ids:
+        return {}
+
+    queued_orders = (
+        select(OrderQueue.order_id)
+        .where(OrderQueue.status == OrderQueueStatusEnum.pending)
+        .distinct()
+        .subquery()
+    )
+    order_stats = (
+        select(
+            Order.restaurant_id,
+            func.count(Order.id).filter(Order.status == OrderStatus.pending).label("pending"),
+            func.count(Order.id).filter(
+                Order.status == OrderStatus.preparing,
+                queued_orders.c.order_id.isnot(None),
+            ).label("preparing"),
+            func.sum(Order.total_price).label("earnings"),
+        )
+        .outerjoin(queued_orders, queued_orders.c.order_id == Order.id)
+        .group_by(Order.restaurant_id)
+        .subquery()
+    )
+    courier_stats = (
+        select(
+            Courier.restaurant_id,
+            func.count(Courier.id).filter(Courier.status == CourierStatus.online).label("online"),
+            func.count(Courier.id).filter(Courier.status == CourierStatus.busy).label("busy"),
+            func.count(Courier.id).filter(Courier.status == CourierStatus.offline).label("offline"),
+        )
+        .group_by(Courier.restaurant_id)
+        .subquery()
+    )
+
+    # A restaurant's average rating rounded to the nearest half like calculate_average_rating, ties to even
+    doubled_average = Restaurant.total_rating * 2.0 / Restaurant.rating_count
+    rounded = cast(func.floor(doubled_average + 0.5), Integer)
+    restaurant_rating = (
+        rounded - case((and_(rounded == doubled_average + 0.5, rounded % 2 == 1), 1), else_=0)
+    ) / 2.0
+
+    rows = db.execute(
+        select(
+            Restaurant.owner_id,
+            func.coalesce(func.sum(order_stats.c.pending), 0),
+            func.coalesce(func.sum(order_stats.c.preparing), 0),
+            func.coalesce(func.sum(courier_stats.c.online), 0),
+            func.coalesce(func.sum(courier_stats.c.busy), 0),
+            func.coalesce(func.sum(courier_stats.c.offline), 0),
+            func.sum(order_stats.c.earnings),
+            func.coalesce(func.sum(case((Restaurant.rating_count > 0, restaurant_rating), else_=0)), 0),
+            func.count(Restaurant.id).filter(Restaurant.rating_count > 0),
+        )
+        .outerjoin(order_stats, order_stats.c.restaurant_id == Restaurant.id)
+        .outerjoin(courier_stats, courier_stats.c.restaurant_id == Restaurant.id)
+        .where(Restaurant.owner_id.in_(owner_ids))
+        .group_by(Restaurant.owner_id)
+    ).all()
+
+    snapshots = {
+        owner_id: {
+            "pendingOrders": 0,
+            "preparingOrders": 0,
+            "onlineCouriers": 0,
+            "busyCouriers": 0,
+            "offlineCouriers": 0,
+            "earnings": None,
+            "ratings": 0,
+        }
+        for owner_id in owner_ids
+    }
+    for owner_id, pending, preparing, online, busy, offline, earnings, rating_sum, rated_restaurants in rows:
+        snapshots[owner_id] = {
+            # PostgreSQL sums counts as NUMERIC
+            "pendingOrders": int(pending),
+            "preparingOrders": int(preparing),
+            "onlineCouriers": int(online),
+            "busyCouriers": int(busy),
+            "offlineCouriers": int(offline),
+            "earnings": float(earnings) if earnings is not None else None,
+            "ratings": calculate_average_rating(float(rating_sum), rated_restaurants),
+        }
+    return snapshots
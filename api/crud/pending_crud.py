@@ -2,9 +2,12 @@ import pytz
 from datetime import datetime, timedelta
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func, DateTime
+from sqlalchemy import DateTime
 from models.models import OrderStatus, Order, OrderItem, OrderQueue, Item, Restaurant, User, RestaurantCapacity, Notification
 from schemas.schemas import UpdateOrderStatusSchema, OrderQueueStatusEnum
+from utils.dispatch_queue_utils import dispatch_queue
+from crud.order_attributes_crud import get_order_attributes
+from crud.notifications_crud import notification_to_dict, publish_notifications
 
 # Retrieves pending orders for a specific restaurant owner and returns order details
 async def get_pending_orders_for_owner(db: Session, owner_id: int):
@@ -64,12 +67,8 @@ async def update_order_status(db: Session, order_id: int, status: str):
     restaurant = db.query(Restaurant).filter(Restaurant.id == order.restaurant_id).first()
 
     if status == OrderStatus.preparing.value:
-        max_prep_time = max(
-            db.query(Item.preparation_time)
-              .join(OrderItem, Item.id == OrderItem.item_id)
-              .filter(OrderItem.order_id == order_id)
-              .all()
-        )[0]
+        attributes = get_order_attributes(db, [order])[order.id]
+        max_prep_time = attributes["max_prep_time"]
 
         capacity_coefficient = {
             RestaurantCapacity.normal: 1,
@@ -86,12 +85,7 @@ async def update_order_status(db: Session, order_id: int, status: str):
 
         estimated_prep_time_no_zone = estimated_prep_time.replace(tzinfo=None)
 
-        total_weight = db.query(
-            func.sum(Item.weight * OrderItem.quantity)
-        ).join(OrderItem, Item.id == OrderItem.item_id).filter(OrderItem.order_id == order_id).scalar()
-
-        if total_weight is None:
-            total_weight = 0.0
+        total_weight = attributes["total_weight"]
 
         new_queue_entry = OrderQueue(
             order_id=order.id,
@@ -118,6 +112,12 @@ async def update_order_status(db: Session, order_id: int, status: str):
         created_at=local_now.replace(tzinfo=None)
     )
     db.add(new_notification)
+    db.flush()
+    published = [(new_notification.user_id, notification_to_dict(new_notification))]
     db.commit()
+    publish_notifications(published)
+
+    if status == OrderStatus.preparing.value:
+        dispatch_queue.notify(f"order {order_id} accepted")
 
     return {"message": "Order status updated"}
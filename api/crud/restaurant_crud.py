@@ -17,6 +17,7 @@ from schemas.schemas import (
     RestaurantUpdate,
     OperatingHoursUpdate
 )
+from utils.delivery_zone_index_utils import delivery_zone_index
 
 # Retrieves all restaurants owned by the current user
 async def get_restaurants_for_owner(db: Session, current_user: User):
@@ -153,6 +154,7 @@ async def create_new_restaurant(db: Session, restaurant: RestaurantCreate):
         db.add(restaurant_delivery_zone)
 
     db.commit()
+    delivery_zone_index.invalidate()
     db.refresh(new_restaurant)
     return new_restaurant
 
@@ -200,6 +202,8 @@ async def update_existing_restaurant(
         await update_operating_hours(db, restaurant_id, restaurant.operating_hours)
 
     db.commit()
+    if restaurant.delivery_zone_ids is not None:
+        delivery_zone_index.invalidate()
     db.refresh(db_restaurant)
     return db_restaurant
 
@@ -223,6 +227,7 @@ async def delete_restaurant_and_related_data(db: Session, restaurant_id: int):
 
     db.delete(db_restaurant)
     db.commit()
+    delivery_zone_index.invalidate()
 
     return {
         "message": "Restaurant and all associated menus, items, and delivery zones deleted successfully"
@@ -1,6 +1,7 @@
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
-from models.models import Courier
+from models.models import Courier, CourierStatus
+from utils.dispatch_queue_utils import dispatch_queue
 
 # Retrieves the current status of a courier by their user ID
 async def get_courier_status(db: Session, courier_id: int):
@@ -18,4 +19,8 @@ async def update_courier_status(db: Session, courier_id: int, new_status: str):
     courier.status = new_status
     db.commit()
     db.refresh(courier)
+
+    if courier.status == CourierStatus.online:
+        dispatch_queue.notify(f"courier {courier.id} online")
+
     return {"status": courier.status}
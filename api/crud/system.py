@@ -1,253 +1,590 @@
+import os
 import json
 import pytz
+import asyncio
+import numpy as np
 from datetime import timedelta, datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, exists
 from models.models import (
     OrderQueue,
     OrderQueueStatusEnum,
     Order,
-    OrderItem,
-    Item,
+    Restaurant,
     Courier,
     CourierStatus,
     VehicleType,
     OrderAssignment,
     OrderAssignmentStatus,
     PaymentMethod,
-    ItemCategory,
     Chat,
     Conversation,
     Notification,
+    ChangeNote,
 )
-from utils.distance_utils import calculate_route_distance, calculate_travel_time
-from utils.change_utils import get_optimal_change, calculate_required_change
-
-# Assigns pending orders to available couriers
-async def assign_orders_to_couriers(db: Session):
-    orders = (
-        db.query(OrderQueue)
-        .filter(OrderQueue.status == OrderQueueStatusEnum.pending)
+from crud.money_crud import get_wallet_notes, get_order_cash_notes
+from crud.order_attributes_crud import get_order_attributes
+from crud.notifications_crud import notification_to_dict, publish_notifications
+from utils.distance_utils import async_calculate_route, async_calculate_route_matrix
+from utils.offline_routing_utils import haversine_distances, calculate_offline_route
+from utils.change_utils import to_cents, solve_change, format_change
+from utils.change_index_utils import change_index
+from utils.unread_counter_utils import unread_counters
+from utils.assignment_utils import solve_min_cost_assignment, INFEASIBLE_COST
+
+# 'greedy' assigns orders one by one in queue order, 'optimal' solves a min-cost matching per tick
+DISPATCH_STRATEGY = os.getenv('DISPATCH_STRATEGY', 'greedy')
+# Maximum number of queue entries one dispatcher claims per tick
+DISPATCH_BATCH_SIZE = int(os.getenv('DISPATCH_BATCH_SIZE', 200))
+
+# Bikes meet the distance criterion up to this route distance in meters, cars beyond it
+MAX_BIKE_DISTANCE = 5000
+
+# Route pairs (order x vehicle type) settled by the straight-line bound versus sent to the router, since startup
+routing_metrics = {
+    "pairs": 0,
+    "pruned": 0,
+    "routed": 0,
+}
+
+# Weights of the optimal strategy's cost; one missed criterion outweighs any travel time or idle bonus
+MISSED_CRITERION_COST = 1000
+IDLE_MINUTE_BONUS = 0.5
+MAX_IDLE_MINUTES = 120
+
+# Pending queue entries joined with their order and restaurant, next in line first
+def _pending_queue_query(db: Session, *entities):
+    return (
+        db.query(*entities)
+        .join(Order, Order.id == OrderQueue.order_id)
+        .join(Restaurant, Restaurant.id == Order.restaurant_id)
+        .filter(
+            OrderQueue.status == OrderQueueStatusEnum.pending,
+            # Orders of restaurants without an online courier cannot be assigned and would only fill the batch
+            exists().where(
+                Courier.restaurant_id == Order.restaurant_id,
+                Courier.status == CourierStatus.online,
+            ),
+        )
+        # Entries tried before without being assigned go to the back, so orders that cannot be assigned for now
+        # never fill every batch ahead of newer ones
+        .order_by(OrderQueue.last_attempted_at.asc().nulls_first(), OrderQueue.id)
+    )
+
+# Reads, without locking anything, the next batch of queue entries with what routing them needs: returns
+# (queue_ids, {order_id: (restaurant_id, restaurant_coords, delivery_coords)}, {restaurant_id: {vehicle_type}})
+def peek_dispatch_queue(db: Session):
+    rows = _pending_queue_query(
+        db,
+        OrderQueue.id,
+        Order.id,
+        Order.restaurant_id,
+        Restaurant.latitude,
+        Restaurant.longitude,
+        Order.delivery_latitude,
+        Order.delivery_longitude,
+    ).limit(DISPATCH_BATCH_SIZE).all()
+
+    queue_ids = [row[0] for row in rows]
+    endpoints = {
+        order_id: (restaurant_id, (restaurant_latitude, restaurant_longitude), (delivery_latitude, delivery_longitude))
+        for _, order_id, restaurant_id, restaurant_latitude, restaurant_longitude, delivery_latitude, delivery_longitude in rows
+    }
+
+    vehicle_types = {}
+    restaurant_ids = {restaurant_id for restaurant_id, _, _ in endpoints.values()}
+    if restaurant_ids:
+        courier_vehicles = (
+            db.query(Courier.restaurant_id, Courier.vehicle_type)
+            .filter(Courier.status == CourierStatus.online, Courier.restaurant_id.in_(restaurant_ids))
+            .distinct()
+            .all()
+        )
+        for restaurant_id, vehicle_type in courier_vehicles:
+            vehicle_types.setdefault(restaurant_id, set()).add(vehicle_type)
+
+    return queue_ids, endpoints, vehicle_types
+
+# Loads everything a dispatch tick needs for the given queue entries in a fixed number of queries, indexed by id
+def load_dispatch_batch(db: Session, queue_ids):
+    # Claim queue rows with FOR UPDATE SKIP LOCKED, so concurrent dispatchers split the queue instead of
+    # assigning the same order; the locks are held until the tick commits
+    queue_rows = (
+        _pending_queue_query(db, OrderQueue, Order, Restaurant)
+        .filter(OrderQueue.id.in_(queue_ids))
+        .with_for_update(of=OrderQueue, skip_locked=True)
         .all()
     )
 
-    if not orders:
-        print("No pending orders found.")
-        return
+    batch = {
+        "entries": [],
+        "orders": {},
+        "restaurants": {},
+        "weights": {},
+        "contains_alcohol": {},
+        "couriers": {},
+        "conversations": {},
+        "last_assigned_at": {},
+        "required_change": {},
+        "wallets": {},
+        "notifications": [],
+        "new_messages": {},
+        "routes": {},
+        "estimated_routes": set(),
+        "estimated_assignments": [],
+    }
 
-    print(f"Found {len(orders)} pending orders in the queue.")
+    if not queue_rows:
+        return batch
 
-    # Loop through each order in the queue
-    for order_queue in orders:
-        order = db.query(Order).filter(Order.id == order_queue.order_id).first()
-        if not order:
-            print(f"Order with ID {order_queue.order_id} not found.")
-            continue
+    for order_queue, order, restaurant in queue_rows:
+        batch["entries"].append(order_queue)
+        batch["orders"][order.id] = order
+        batch["restaurants"][restaurant.id] = restaurant
+        batch["weights"][order.id] = order_queue.weight
+
+    restaurant_ids = list(batch["restaurants"].keys())
+    customer_ids = {order.customer_id for order in batch["orders"].values()}
+
+    # Stored on the order at creation; only older orders fall back to aggregating their items
+    for order_id, attributes in get_order_attributes(db, batch["orders"].values()).items():
+        batch["contains_alcohol"][order_id] = attributes["contains_alcohol"]
 
-        # Check if the order contains alcohol
-        contains_alcohol = (
-            db.query(Item.category)
-            .join(OrderItem, Item.id == OrderItem.item_id)
+    # Change owed on cash orders, in cents, from the notes the customer pays with
+    cash_order_ids = [
+        order.id for order in batch["orders"].values() if order.payment_method == PaymentMethod.cash
+    ]
+    payments = get_order_cash_notes(db, cash_order_ids)
+    for order_id in cash_order_ids:
+        paid = sum(cents * quantity for cents, quantity in payments.get(order_id, {}).items())
+        batch["required_change"][order_id] = paid - to_cents(batch["orders"][order_id].total_price)
+
+    # Couriers are claimed the same way, so two dispatchers never mark the same courier busy
+    couriers = (
+        db.query(Courier)
+        .filter(
+            Courier.status == CourierStatus.online,
+            Courier.restaurant_id.in_(restaurant_ids),
+        )
+        .order_by(Courier.id)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for courier in couriers:
+        batch["couriers"].setdefault(courier.restaurant_id, []).append(courier)
+
+    if couriers:
+        last_assignments = (
+            db.query(OrderAssignment.courier_id, func.max(OrderAssignment.assigned_at))
+            .filter(OrderAssignment.courier_id.in_([courier.id for courier in couriers]))
+            .group_by(OrderAssignment.courier_id)
+            .all()
+        )
+        batch["last_assigned_at"] = dict(last_assignments)
+
+        # Only wallets holding at least the smallest change owed in this batch can matter, the rest stay in the database
+        owed = [change for change in batch["required_change"].values() if change > 0]
+        if owed:
+            batch["wallets"] = get_wallet_notes(
+                db, [courier.id for courier in couriers], min_cash_on_hand=min(owed)
+            )
+
+    courier_user_ids = {courier.user_id for courier in couriers}
+    if courier_user_ids:
+        conversations = (
+            db.query(Conversation)
             .filter(
-                OrderItem.order_id == order.id, Item.category == ItemCategory.alcohol
+                Conversation.participant1_id.in_(courier_user_ids),
+                Conversation.participant2_id.in_(customer_ids),
             )
-            .count()
-            > 0
+            .all()
+        )
+        for conversation in conversations:
+            key = (conversation.participant1_id, conversation.participant2_id)
+            batch["conversations"].setdefault(key, conversation)
+
+    return batch
+
+# Fetches the route of every queued order for every vehicle type its restaurant's couriers use, requesting the
+# matrices of all vehicle types concurrently. Takes peek_dispatch_queue's endpoints and vehicle types and returns
+# ({(order_id, vehicle_type): (distance, travel_time)}, the set of those keys that were only estimated).
+async def load_route_matrix(endpoints: dict, vehicle_types: dict):
+    order_ids = list(endpoints)
+
+    # A road route is never shorter than the straight line, so an order farther than the bike limit as the crow flies
+    # fails the bike rule whatever the road; its bike route is estimated without calling the router. Car routes are
+    # always routed, since their travel times rank couriers and become the delivery estimate.
+    straight_line = haversine_distances(
+        [endpoints[order_id][1] for order_id in order_ids],
+        [endpoints[order_id][2] for order_id in order_ids],
+    )
+    conclusive_ids = {
+        order_id for order_id, distance in zip(order_ids, straight_line) if distance > MAX_BIKE_DISTANCE
+    }
+
+    routes = {}
+    estimated = set()
+    matrix_requests = []
+    for vehicle_type in set().union(*vehicle_types.values()):
+        vehicle_order_ids = [
+            order_id
+            for order_id in order_ids
+            if vehicle_type in vehicle_types.get(endpoints[order_id][0], ())
+        ]
+        routed_ids = []
+        for order_id in vehicle_order_ids:
+            if vehicle_type == VehicleType.bike and order_id in conclusive_ids:
+                routes[(order_id, vehicle_type)] = calculate_offline_route(*endpoints[order_id][1:], vehicle_type.value)
+                estimated.add((order_id, vehicle_type))
+            else:
+                routed_ids.append(order_id)
+
+        routing_metrics["pairs"] += len(vehicle_order_ids)
+        routing_metrics["pruned"] += len(vehicle_order_ids) - len(routed_ids)
+        routing_metrics["routed"] += len(routed_ids)
+
+        if routed_ids:
+            pairs = [endpoints[order_id][1:] for order_id in routed_ids]
+            matrix_requests.append((vehicle_type, routed_ids, pairs))
+
+    matrices = await asyncio.gather(
+        *(async_calculate_route_matrix(pairs, vehicle_type.value) for vehicle_type, _, pairs in matrix_requests)
+    )
+
+    for (vehicle_type, routed_ids, _), matrix in zip(matrix_requests, matrices):
+        for order_id, route in zip(routed_ids, matrix):
+            routes[(order_id, vehicle_type)] = route
+
+    return routes, estimated
+
+# Returns the couriers of the order's restaurant that are still online and meet the halal/alcohol criteria
+def get_candidate_couriers(batch: dict, order: Order):
+    contains_alcohol = batch["contains_alcohol"][order.id]
+    return [
+        courier
+        for courier in batch["couriers"].get(order.restaurant_id, [])
+        if courier.status == CourierStatus.online
+        and (not contains_alcohol or courier.halal_mode == False)
+    ]
+
+# Returns the change in cents the customer of a cash order has to get back, None for card orders
+def get_required_change(batch: dict, order: Order):
+    required_change = batch["required_change"].get(order.id)
+    if required_change is not None:
+        print(f"Required change for order ID {order.id}: {required_change / 100:.2f}BAM")
+    return required_change
+
+# Checks which couriers can return the order's exact change, one bit lookup per courier in the change index.
+# Returns {courier_id: bool}, or None when the order is not paid in cash.
+def get_change_checks(batch: dict, required_change, couriers: list):
+    if required_change is None:
+        return None
+
+    return {
+        courier.id: change_index.can_return(courier.id, batch["wallets"].get(courier.id, {}), required_change)
+        for courier in couriers
+    }
+
+# Evaluates a courier for an order based on weight, distance, and change criteria.
+# Returns None when the order cannot be routed for the courier's vehicle type.
+def evaluate_courier(batch: dict, order: Order, courier: Courier, change_checks: dict):
+    # Look up the delivery distance based on the courier's vehicle type
+    route = batch["routes"].get((order.id, courier.vehicle_type))
+    if route is None:
+        print(
+            f"No route found for order ID {order.id} using {courier.vehicle_type.value}, skipping courier ID {courier.id}."
+        )
+        return None
+    distance, travel_time = route
+
+    # Check if the courier meets weight and distance criteria
+    meets_weight = (
+        courier.vehicle_type == VehicleType.car
+        or batch["weights"][order.id] <= 6000
+    )
+
+    meets_distance = (
+        courier.vehicle_type == VehicleType.bike and distance <= MAX_BIKE_DISTANCE
+    ) or (courier.vehicle_type == VehicleType.car and distance > MAX_BIKE_DISTANCE)
+
+    # If the payment method is cash, check if the courier can return the correct change
+    meets_change = True
+
+    if change_checks is not None:
+        meets_change = change_checks[courier.id]
+        print(
+            f"Courier {courier.id} can return exact change: {meets_change}"
+        )
+
+    # Count how many criteria the courier meets
+    criteria_count = sum([meets_weight, meets_distance, meets_change])
+
+    print(f"Evaluating Courier ID {courier.id} for order ID {order.id}:")
+    print(f"  - Meets weight criteria: {meets_weight}")
+    print(f"  - Meets distance criteria: {meets_distance}")
+    print(f"  - Meets change criteria: {meets_change}")
+    print(f"  - Total criteria met: {criteria_count}")
+
+    return {
+        "criteria_count": criteria_count,
+        "travel_time": travel_time,
+    }
+
+# Creates the assignment for the chosen courier, marks the courier busy and notifies the courier and the customer
+def record_assignment(db: Session, batch: dict, order_queue: OrderQueue, courier: Courier, evaluation: dict):
+    order = batch["orders"][order_queue.order_id]
+    restaurant = batch["restaurants"][order.restaurant_id]
+
+    # Only the chosen courier's exact notes are worked out; candidates were checked in the change index
+    change = None
+    required_change = get_required_change(batch, order)
+    if required_change is not None:
+        change = solve_change(required_change, batch["wallets"].get(courier.id, {}))
+    optimal_change = format_change(change) if change else None
+
+    travel_time_delta = timedelta(minutes=evaluation["travel_time"])
+
+    estimated_delivery_time = (
+        order_queue.estimated_preparation_time + travel_time_delta
+    )
+
+    new_assignment = OrderAssignment(
+        order_id=order.id,
+        courier_id=courier.id,
+        status=OrderAssignmentStatus.in_delivery,
+        estimated_delivery_time=estimated_delivery_time,
+        optimal_change=json.dumps(optimal_change) if optimal_change else None,
+        change_notes=[
+            ChangeNote(denomination=cents, quantity=quantity)
+            for cents, quantity in (change or {}).items()
+        ],
+    )
+
+    db.add(new_assignment)
+    if (order.id, courier.vehicle_type) in batch["estimated_routes"]:
+        batch["estimated_assignments"].append((new_assignment, order_queue, courier.vehicle_type))
+    order_queue.status = OrderQueueStatusEnum.assigned
+    courier.status = CourierStatus.busy
+
+    local_timezone = pytz.timezone("Europe/Sarajevo")
+    local_now = datetime.now(local_timezone)
+
+    message = f"You have a new order to deliver from {restaurant.name}."
+    new_notification = Notification(
+        user_id=courier.user_id,
+        message=message,
+        read=False,
+        created_at=local_now.replace(tzinfo=None),
+    )
+    db.add(new_notification)
+    batch["notifications"].append(new_notification)
+
+    conversation_key = (courier.user_id, order.customer_id)
+    conversation = batch["conversations"].get(conversation_key)
+
+    if not conversation:
+        conversation = Conversation(
+            participant1_id=courier.user_id,
+            participant2_id=order.customer_id,
         )
+        db.add(conversation)
+        db.flush()
+        batch["conversations"][conversation_key] = conversation
+
+    # Send a message to the customer informing about the courier assignment
+    message_content = "Dear customer, your order has been assigned to me, and I will be delivering it shortly. Thank you for your patience!"
+    new_chat = Chat(
+        sender_id=courier.user_id,
+        receiver_id=order.customer_id,
+        message=message_content,
+        conversation_id=conversation.id,
+        created_at=local_now.replace(tzinfo=None),
+    )
+    db.add(new_chat)
+    batch["new_messages"][order.customer_id] = batch["new_messages"].get(order.customer_id, 0) + 1
+
+    print(
+        f"Order ID {order.id} assigned to courier ID {courier.id} with optimal change: {optimal_change}."
+    )
+
+# Assigns orders in queue order, each to the first courier meeting the most criteria
+def assign_greedily(db: Session, batch: dict):
+    # Loop through each order in the queue
+    for order_queue in batch["entries"]:
+        order = batch["orders"][order_queue.order_id]
+        contains_alcohol = batch["contains_alcohol"][order.id]
 
         print(f"Order ID {order.id} contains alcohol: {contains_alcohol}")
 
-        # Find couriers who are available and meet the halal/alcohol criteria
-        if contains_alcohol:
-            couriers = (
-                db.query(Courier)
-                .filter(
-                    Courier.status == CourierStatus.online,
-                    Courier.halal_mode == False,
-                    Courier.restaurant_id == order.restaurant_id,
-                )
-                .all()
-            )
+        # Couriers assigned earlier in this tick are already marked busy and are skipped here
+        couriers = get_candidate_couriers(batch, order)
+        print(
+            f"Found {len(couriers)} eligible online couriers for restaurant ID {order.restaurant_id}."
+        )
+
+        change_checks = get_change_checks(batch, get_required_change(batch, order), couriers)
+
+        # Keep the first courier of the best criteria bucket
+        assigned_courier = None
+        assigned_evaluation = None
+        for courier in couriers:
+            evaluation = evaluate_courier(batch, order, courier, change_checks)
+            if evaluation is None:
+                continue
+            if assigned_evaluation is None or evaluation["criteria_count"] > assigned_evaluation["criteria_count"]:
+                assigned_courier = courier
+                assigned_evaluation = evaluation
+
+        # If a courier is assigned, update order and courier status
+        if assigned_courier:
             print(
-                f"Found {len(couriers)} online couriers not in halal mode for restaurant ID {order.restaurant_id}."
+                f"Assigned courier ID {assigned_courier.id} meeting {assigned_evaluation['criteria_count'] + 2} criteria."
             )
+            record_assignment(db, batch, order_queue, assigned_courier, assigned_evaluation)
         else:
-            couriers = (
-                db.query(Courier)
-                .filter(
-                    Courier.status == CourierStatus.online,
-                    Courier.restaurant_id == order.restaurant_id,
-                )
-                .all()
-            )
+            print(f"No suitable courier found for order ID {order.id}.")
+
+# Cost of pairing an order with a courier: missed criteria dominate, then travel time, minus a bonus for couriers idle longer
+def get_assignment_cost(batch: dict, courier: Courier, evaluation: dict, now: datetime):
+    last_assigned_at = batch["last_assigned_at"].get(courier.id)
+    idle_minutes = (
+        (now - last_assigned_at).total_seconds() / 60
+        if last_assigned_at
+        else MAX_IDLE_MINUTES
+    )
+    idle_minutes = min(max(idle_minutes, 0), MAX_IDLE_MINUTES)
+
+    return (
+        MISSED_CRITERION_COST * (3 - evaluation["criteria_count"])
+        + evaluation["travel_time"]
+        - IDLE_MINUTE_BONUS * idle_minutes
+    )
+
+# Assigns all pending orders at once by solving a minimum-cost matching of orders x couriers per restaurant
+def assign_optimally(db: Session, batch: dict):
+    now = datetime.utcnow()
+
+    # Couriers only deliver for their own restaurant, so every restaurant is an independent matching problem
+    entries_by_restaurant = {}
+    for order_queue in batch["entries"]:
+        order = batch["orders"][order_queue.order_id]
+        entries_by_restaurant.setdefault(order.restaurant_id, []).append(order_queue)
+
+    for restaurant_id, entries in entries_by_restaurant.items():
+        couriers = [
+            courier
+            for courier in batch["couriers"].get(restaurant_id, [])
+            if courier.status == CourierStatus.online
+        ]
+        if not couriers:
+            print(f"No online couriers for restaurant ID {restaurant_id}.")
+            continue
+
+        cost_matrix = np.full((len(entries), len(couriers)), INFEASIBLE_COST)
+        evaluations = {}
+
+        for row, order_queue in enumerate(entries):
+            order = batch["orders"][order_queue.order_id]
+            eligible = get_candidate_couriers(batch, order)
+            eligible_ids = {courier.id for courier in eligible}
+            change_checks = get_change_checks(batch, get_required_change(batch, order), eligible)
+
+            for column, courier in enumerate(couriers):
+                if courier.id not in eligible_ids:
+                    continue
+                evaluation = evaluate_courier(batch, order, courier, change_checks)
+                if evaluation is None:
+                    continue
+                evaluations[(row, column)] = evaluation
+                cost_matrix[row, column] = get_assignment_cost(batch, courier, evaluation, now)
+
+        matched_rows = set()
+        for row, column in solve_min_cost_assignment(cost_matrix):
+            matched_rows.add(row)
+            evaluation = evaluations[(row, column)]
             print(
-                f"Found {len(couriers)} online couriers for restaurant ID {order.restaurant_id}."
+                f"Matched courier ID {couriers[column].id} meeting {evaluation['criteria_count'] + 2} criteria."
             )
+            record_assignment(db, batch, entries[row], couriers[column], evaluation)
 
-        # Prepare lists for couriers meeting various levels of criteria
-        couriers_five_criteria = []
-        couriers_four_criteria = []
-        couriers_three_criteria = []
-        couriers_two_criteria = []
+        for row, order_queue in enumerate(entries):
+            if row not in matched_rows:
+                print(f"No suitable courier found for order ID {order_queue.order_id}.")
 
-        # Evaluate each courier based on weight, distance, and change criteria
-        for courier in couriers:
-            # Calculate the delivery distance based on the courier's vehicle type
-            distance = calculate_route_distance(
-                (order.restaurant.latitude, order.restaurant.longitude),
-                (order.delivery_latitude, order.delivery_longitude),
-                courier.vehicle_type.value,
-            )
+# Routes the assignments whose route was only estimated by the straight-line bound, so their delivery estimate comes
+# from the router like every other assignment's; the estimate is kept when routing fails. Runs after the tick
+# committed, so no row stays locked while the router answers. assignments are
+# (assignment_id, order_id, estimated_preparation_time, vehicle_type) tuples.
+async def route_estimated_assignments(db: Session, endpoints: dict, assignments: list):
+    if not assignments:
+        return
 
-            # Check if the courier meets weight and distance criteria
-            meets_weight = (
-                courier.vehicle_type == VehicleType.car or order_queue.weight <= 6000
-            )
+    routes = await asyncio.gather(
+        *(
+            async_calculate_route(*endpoints[order_id][1:], vehicle_type.value)
+            for _, order_id, _, vehicle_type in assignments
+        ),
+        return_exceptions=True,
+    )
+    for (assignment_id, order_id, preparation_time, _), route in zip(assignments, routes):
+        if isinstance(route, Exception) or route is None:
+            print(f"Keeping the estimated delivery time of order ID {order_id}: {route}")
+            continue
+        db.query(OrderAssignment).filter(OrderAssignment.id == assignment_id).update(
+            {OrderAssignment.estimated_delivery_time: preparation_time + timedelta(minutes=route[1])},
+            synchronize_session=False,
+        )
+    db.commit()
 
+# Assigns pending orders to available couriers using the configured strategy ('greedy' or 'optimal')
+async def assign_orders_to_couriers(db: Session, strategy: str = None):
+    strategy = strategy or DISPATCH_STRATEGY
 
-            meets_distance = (
-                courier.vehicle_type == VehicleType.bike and distance <= 5000
-            ) or (courier.vehicle_type == VehicleType.car and distance > 5000)
-
-            # If the payment method is cash, check if the courier can return the correct change
-            meets_change = True
-            optimal_change = None
-
-            if order.payment_method == PaymentMethod.cash:
-                print(
-                    f"Order {order.id} is paid in cash. Calculating if courier can return the exact change."
-                )
-
-                if courier.wallet_details:
-                    money_data = json.loads(order.money)
-                    total_money = sum(
-                        float(denomination[:-3]) * quantity
-                        for denomination, quantity in money_data.items()
-                    )
-
-                    print(f"Total money given by customer: {total_money}")
-
-                    required_change = calculate_required_change(
-                        order.total_price, total_money
-                    )
-                    meets_change, optimal_change = get_optimal_change(
-                        required_change, courier.wallet_details
-                    )
-                    print(
-                        f"Courier {courier.id} can return exact change: {meets_change}"
-                    )
-                    if meets_change:
-                        print(
-                            f"Optimal change for courier {courier.id} to return: {optimal_change}"
-                        )
-                else:
-                    meets_change = False
-                    print(
-                        f"Courier {courier.id} does not have wallet details, cannot return change."
-                    )
-
-            # Count how many criteria the courier meets
-            criteria_count = sum([meets_weight, meets_distance, meets_change])
-
-            print(f"Evaluating Courier ID {courier.id}:")
-            print(f"  - Meets weight criteria: {meets_weight}")
-            print(f"  - Meets distance criteria: {meets_distance}")
-            print(f"  - Meets change criteria: {meets_change}")
-            print(f"  - Total criteria met: {criteria_count}")
-
-             # Add courier to the corresponding list based on criteria met
-            if criteria_count == 3:
-                couriers_five_criteria.append(courier)
-            elif criteria_count == 2:
-                couriers_four_criteria.append(courier)
-            elif criteria_count == 1:
-                couriers_three_criteria.append(courier)
-            else:
-                couriers_two_criteria.append(courier)
+    # Routing talks to the network, so it happens before the tick claims any row; the read transaction ends first
+    queue_ids, endpoints, vehicle_types = peek_dispatch_queue(db)
+    db.commit()
 
-        # Assign the best suitable courier based on the criteria
-        assigned_courier = None
-        if couriers_five_criteria:
-            assigned_courier = couriers_five_criteria[0]
-            print(f"Assigned courier ID {assigned_courier.id} meeting 5 criteria.")
-        elif couriers_four_criteria:
-            assigned_courier = couriers_four_criteria[0]
-            print(f"Assigned courier ID {assigned_courier.id} meeting 4 criteria.")
-        elif couriers_three_criteria:
-            assigned_courier = couriers_three_criteria[0]
-            print(f"Assigned courier ID {assigned_courier.id} meeting 3 criteria.")
-        elif couriers_two_criteria:
-            assigned_courier = couriers_two_criteria[0]
-            print(f"Assigned courier ID {assigned_courier.id} meeting 2 criteria.")
-
-        # If a courier is assigned, calculate travel time and update order and courier status
-        if assigned_courier:
-            travel_time = calculate_travel_time(
-                (order.restaurant.latitude, order.restaurant.longitude),
-                (order.delivery_latitude, order.delivery_longitude),
-                assigned_courier.vehicle_type.value,
-            )
-            travel_time_delta = timedelta(minutes=travel_time)
+    if not queue_ids:
+        print("No pending orders found.")
+        return
 
-            estimated_delivery_time = (
-                order_queue.estimated_preparation_time + travel_time_delta
-            )
+    # Distances and travel times for the whole tick, so couriers are scored without per-pair routing calls
+    routes, estimated_routes = await load_route_matrix(endpoints, vehicle_types)
 
-            new_assignment = OrderAssignment(
-                order_id=order.id,
-                courier_id=assigned_courier.id,
-                status=OrderAssignmentStatus.in_delivery,
-                estimated_delivery_time=estimated_delivery_time,
-                optimal_change=json.dumps(optimal_change) if optimal_change else None,
-            )
+    # Entries another dispatcher claimed or assigned in the meantime are skipped
+    batch = load_dispatch_batch(db, queue_ids)
+    if not batch["entries"]:
+        db.commit()
+        print("The peeked orders were claimed by another dispatcher.")
+        return
 
-            db.add(new_assignment)
-            order_queue.status = OrderQueueStatusEnum.assigned
-            assigned_courier.status = CourierStatus.busy
+    print(f"Found {len(batch['entries'])} pending orders in the queue, dispatching with the {strategy} strategy.")
+    batch["routes"] = routes
+    batch["estimated_routes"] = estimated_routes
 
-            local_timezone = pytz.timezone("Europe/Sarajevo")
-            local_now = datetime.now(local_timezone)
+    if strategy == "optimal":
+        assign_optimally(db, batch)
+    else:
+        assign_greedily(db, batch)
 
-            message = f"You have a new order to deliver from {order.restaurant.name}."
-            new_notification = Notification(
-                user_id=assigned_courier.user_id,
-                message=message,
-                read=False,
-                created_at=local_now.replace(tzinfo=None),
-            )
-            db.add(new_notification)
-
-            conversation = (
-                db.query(Conversation)
-                .filter(
-                    (Conversation.participant1_id == assigned_courier.user_id)
-                    & (Conversation.participant2_id == order.customer_id)
-                )
-                .first()
-            )
+    attempted_at = datetime.utcnow()
+    for order_queue in batch["entries"]:
+        if order_queue.status == OrderQueueStatusEnum.pending:
+            order_queue.last_attempted_at = attempted_at
 
-            if not conversation:
-                conversation = Conversation(
-                    participant1_id=assigned_courier.user_id,
-                    participant2_id=order.customer_id,
-                )
-                db.add(conversation)
-                db.flush()
-
-            # Send a message to the customer informing about the courier assignment
-            message_content = "Dear customer, your order has been assigned to me, and I will be delivering it shortly. Thank you for your patience!"
-            new_chat = Chat(
-                sender_id=assigned_courier.user_id,
-                receiver_id=order.customer_id,
-                message=message_content,
-                conversation_id=conversation.id,
-                created_at=local_now.replace(tzinfo=None),
-            )
-            db.add(new_chat)
+    # Commit the whole tick at once so loaded rows are not expired and re-fetched between assignments.
+    # The new notifications are serialized before the commit expires them and pushed once it succeeded.
+    db.flush()
+    published = [
+        (notification.user_id, notification_to_dict(notification))
+        for notification in batch["notifications"]
+    ]
+    estimated_assignments = [
+        (assignment.id, order_queue.order_id, order_queue.estimated_preparation_time, vehicle_type)
+        for assignment, order_queue, vehicle_type in batch["estimated_assignments"]
+    ]
+    db.commit()
+    publish_notifications(published)
+    unread_counters.apply(batch["new_messages"])
 
-            db.commit()
-            print(
-                f"Order ID {order.id} assigned to courier ID {assigned_courier.id} with optimal change: {optimal_change}."
-            )
-        else:
-            print(f"No suitable courier found for order ID {order.id}.")
+    await route_estimated_assignments(db, endpoints, estimated_assignments)
@@ -0,0 +1,39 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from models.models import Order, OrderQueue
+
+# Columns added to tables that already existed; create_all creates missing tables but never alters existing ones.
+# Every added column must be nullable, so rows written before it existed keep working through their NULL fallback.
+ADDED_COLUMNS = [
+    Order.__table__.c.contains_alcohol,
+    Order.__table__.c.total_weight,
+    Order.__table__.c.max_prep_time,
+    Order.__table__.c.item_count,
+    Order.__table__.c.location_verified,
+    OrderQueue.__table__.c.last_attempted_at,
+]
+
+# Adds the columns of ADDED_COLUMNS that the database is missing. Safe to run on every start, and by several
+# workers at once: Postgres skips existing columns itself, other databases are checked first.
+def upgrade_schema(engine):
+    existing = {}
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for column in ADDED_COLUMNS:
+            table = column.table.name
+            if table not in existing:
+                existing[table] = {c["name"] for c in inspector.get_columns(table)}
+            if column.name in existing[table]:
+                continue
+
+            column_type = column.type.compile(dialect=engine.dialect)
+            if_not_exists = "IF NOT EXISTS " if engine.dialect.name == "postgresql" else ""
+            try:
+                with connection.begin_nested():
+                    connection.execute(text(
+                        f'ALTER TABLE {table} ADD COLUMN {if_not_exists}{column.name} {column_type}'
+                    ))
+                print(f"Added column {table}.{column.name}")
+            except (OperationalError, ProgrammingError) as e:
+                # Another worker added it first
+                print(f"Column {table}.{column.name} was not added: {e}")
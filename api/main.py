@@ -4,13 +4,15 @@ from fastapi import (
     FastAPI,
     Depends,
     HTTPException,
+    Query,
+    BackgroundTasks,
     File,
     UploadFile,
     Form,
     WebSocket,
     WebSocketDisconnect,
 )
-from fastapi.websockets import WebSocket, WebSocketState
+from fastapi.websockets import WebSocket
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
@@ -18,13 +20,13 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 
 from database.database import SessionLocal, engine, get_db
+from database.schema_upgrades import upgrade_schema
 from models.models import (
     Base,
     User,
     Image,
     Restaurant,
     MenuCategory,
-    Chat
 )
 from schemas.schemas import (
     UserCreate,
@@ -61,7 +63,23 @@ from utils.scheduled_tasks_utils import (
     deny_requests_and_send_emails,
     remind_pending_requests,
 )
+from utils.dispatch_queue_utils import dispatch_queue
+from utils.route_cache_utils import route_cache
+from utils.change_index_utils import change_index
+from utils.delivery_zone_index_utils import delivery_zone_index
+from utils.geocoding_utils import geocoding_service
+from utils.notification_hub_utils import notification_hub, stream_notifications
+from utils.unread_counter_utils import unread_counters, stream_unread_count
+from utils.broadcast_backend_utils import broadcast
+from utils.chat_rooms_utils import chat_rooms
+from utils.stats_broadcaster_utils import (
+    StatsBroadcaster,
+    KeyedStatsBroadcaster,
+    stream_snapshots,
+    STATS_INTERVAL_SECONDS,
+)
 
+from crud.money_crud import backfill_money_notes
 from crud.user_crud import (
     create_user,
     get_user_by_username,
@@ -129,43 +147,27 @@ from crud.chat_crud import (
     get_user_chat_history,
     get_users_sorted_by_role,
     handle_send_message,
+    mark_conversation_read,
 )
 from crud.customer_crud import (
     search_restaurants,
     search_items,
     get_restaurant_details,
     get_restaurant_menu,
+    get_restaurants_delivering_here,
 )
 from crud.order_crud import create_order
 from crud.status_crud import get_courier_status, update_courier_status
 from crud.pending_crud import get_pending_orders_for_owner, update_order_status
-from crud.system import assign_orders_to_couriers
+from crud.system import assign_orders_to_couriers, routing_metrics
 from crud.track_orders_crud import get_customer_orders
 from crud.rating_crud import submit_rating
 from crud.order_history import get_customer_order_history_with_items
 from crud.deliver_order_crud import get_orders_for_courier, finish_order
 from crud.courier_crud import has_unfinished_orders
 from crud.delivered_orders_crud import get_delivered_orders
-from crud.admin_statistic_crud import (
-    a_get_pending_orders,
-    a_get_preparing_orders,
-    a_get_in_delivery_orders,
-    a_get_online_couriers,
-    a_get_busy_couriers,
-    a_get_offline_couriers,
-    a_get_open_restaurants,
-    a_get_closing_soon_restaurants,
-    a_get_closed_restaurants,
-)
-from crud.owner_statistic_crud import (
-    o_get_pending_orders_owner,
-    o_get_preparing_orders_owner,
-    o_get_online_couriers_owner,
-    o_get_busy_couriers_owner,
-    o_get_offline_couriers_owner,
-    o_get_earnings_owner,
-    o_get_ratings_owner,
-)
+from crud.admin_statistic_crud import a_get_admin_stats
+from crud.owner_statistic_crud import o_get_owner_stats_batch
 from crud.courier_statistic_crud import (
     c_get_active_orders,
     c_get_restaurant_count,
@@ -174,7 +176,7 @@ from crud.courier_statistic_crud import (
 )
 from crud.top_restaurants_crud import get_top_restaurants
 from crud.notifications_crud import (
-    get_notifications,
+    get_notification_backfill,
     mark_as_read
 )
 from crud.owner_report_crud import owner_report
@@ -184,8 +186,11 @@ from crud.courier_report_crud import courier_report
 # Function to schedule assigning orders to couriers
 async def schedule_assign_orders_to_couriers():
     print("Function for assigning orders to couriers start!")
-    db: Session = next(get_db())
-    await assign_orders_to_couriers(db)
+    db = SessionLocal()
+    try:
+        await assign_orders_to_couriers(db)
+    finally:
+        db.close()
 
 
 # Initializes the FastAPI application and sets up CORS middleware
@@ -206,6 +211,18 @@ def start_application():
 app = start_application()
 
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
+
+# Fill the wallet, payment and change note tables for rows stored only as JSON before those tables existed
+backfill_db = SessionLocal()
+try:
+    backfill_money_notes(backfill_db)
+except Exception as e:
+    # A failed backfill must not stop the worker; it is retried on the next start
+    backfill_db.rollback()
+    print(f"Error while backfilling money notes: {e}")
+finally:
+    backfill_db.close()
 
 
 # Function to generate the owner's report
@@ -226,6 +243,9 @@ async def schedule_courier_report():
         db.close()
 
 
+# Dispatch runs on its own thread and reacts to order acceptance and couriers going online
+dispatch_queue.start(schedule_assign_orders_to_couriers)
+
 # Adding scheduled tasks to APScheduler
 scheduler = BackgroundScheduler()
 scheduler.add_job(lambda: asyncio.run(schedule_owner_report()), CronTrigger(hour=0, minute=0))
@@ -236,8 +256,13 @@ scheduler.add_job(
 scheduler.add_job(
     lambda: asyncio.run(remind_pending_requests()), CronTrigger(hour=0, minute=3)
 )
+# Periodic sweep as a safety net for orders whose dispatch event found no courier
 scheduler.add_job(
-    lambda: asyncio.run(schedule_assign_orders_to_couriers()), 'interval', seconds=45
+    lambda: dispatch_queue.notify("periodic sweep"), 'interval', seconds=45
+)
+# Expired routes are otherwise only dropped when looked up again, so the cache file would keep growing
+scheduler.add_job(
+    lambda: print(f"Purged {route_cache.purge_expired()} expired routes from the route cache"), CronTrigger(hour=0, minute=4)
 )
 scheduler.start()
 
@@ -245,7 +270,10 @@ if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
-connections = {}
+# One producer computes the admin dashboard for every connected admin
+admin_stats_broadcaster = StatsBroadcaster("admin", a_get_admin_stats, STATS_INTERVAL_SECONDS)
+# One grouped query per interval computes the dashboards of every connected owner
+owner_stats_broadcaster = KeyedStatsBroadcaster("owner", o_get_owner_stats_batch, STATS_INTERVAL_SECONDS)
 
 
 # WebSocket endpoint for real-time chat between users in a conversation
@@ -254,26 +282,28 @@ async def websocket_chat_endpoint(websocket: WebSocket, conversation_id: int):
     await websocket.accept()
     print(f"New WebSocket connection for conversation: {conversation_id}")
 
-    if conversation_id not in connections:
-        connections[conversation_id] = []
-    connections[conversation_id].append(websocket)
+    connection = chat_rooms.join(conversation_id, websocket)
 
     try:
         while True:
             data = await websocket.receive_text()
-            print(f"Received message: {data}")
+            chat_rooms.touch(connection)
 
             parsed_data = json.loads(data)
+            # Heartbeat replies only keep the connection alive
+            if isinstance(parsed_data, dict) and parsed_data.get("type") == "pong":
+                continue
+            print(f"Received message: {data}")
 
-            for connection in connections.get(conversation_id, []):
-                if connection.client_state == WebSocketState.CONNECTED:
-                    await connection.send_text(json.dumps(parsed_data))
+            chat_rooms.publish(conversation_id, json.dumps(parsed_data))
 
     except WebSocketDisconnect:
         print(f"WebSocket disconnected for conversation: {conversation_id}")
-        connections[conversation_id].remove(websocket)
-        if len(connections[conversation_id]) == 0:
-            del connections[conversation_id]
+    except RuntimeError:
+        # The connection manager closed the socket
+        print(f"WebSocket closed for conversation: {conversation_id}")
+    finally:
+        chat_rooms.leave(connection)
 
 
 # WebSocket endpoint for real-time notifications of unread messages for a user
@@ -281,75 +311,22 @@ async def websocket_chat_endpoint(websocket: WebSocket, conversation_id: int):
 async def websocket_messages_endpoint(websocket: WebSocket, user_id: int):
     await websocket.accept()
     print(f"New WebSocket connection for user: {user_id}")
-
-    try:
-        while True:
-            db = SessionLocal()
-            unread_count = db.query(Chat).filter(Chat.receiver_id == user_id, Chat.is_seen == False).count()
-            if websocket.client_state == WebSocketState.CONNECTED:
-                await websocket.send_text(json.dumps({"unread_count": unread_count}))
-            await asyncio.sleep(10)
-
-    except WebSocketDisconnect:
-        print(f"WebSocket disconnected for user: {user_id}")
+    await stream_unread_count(websocket, user_id)
+    print(f"WebSocket disconnected for user: {user_id}")
 
 
 # WebSocket endpoint for real-time admin statistics
 @app.websocket("/ws/admin-stats")
 async def websocket_stats(websocket: WebSocket):
     await websocket.accept()
-    db = SessionLocal()
-    try:
-        while True:
-            stats_data = {
-                "pendingOrders": a_get_pending_orders(db),
-                "preparingOrders": a_get_preparing_orders(db),
-                "inDeliveryOrders": a_get_in_delivery_orders(db),
-                "onlineCouriers": a_get_online_couriers(db),
-                "busyCouriers": a_get_busy_couriers(db),
-                "offlineCouriers": a_get_offline_couriers(db),
-                "openRestaurants": a_get_open_restaurants(db),
-                "closingSoonRestaurants": a_get_closing_soon_restaurants(db),
-                "closedRestaurants": a_get_closed_restaurants(db),
-            }
-            try:
-                await websocket.send_json(stats_data)
-            except WebSocketDisconnect:
-                print("WebSocket disconnected")
-                break
-            await asyncio.sleep(5)
-    except Exception as e:
-        print(f"Error: {e}")
-    finally:
-        db.close()
+    await stream_snapshots(websocket, admin_stats_broadcaster)
 
 
 # WebSocket endpoint for real-time statistics specific to an owner
 @app.websocket("/ws/owner-stats/{owner_id}")
 async def websocket_owner_stats(websocket: WebSocket, owner_id: int):
-    db = SessionLocal()
     await websocket.accept()
-    try:
-        while True:
-            stats_data = {
-                "pendingOrders": o_get_pending_orders_owner(db, owner_id),
-                "preparingOrders": o_get_preparing_orders_owner(db, owner_id),
-                "onlineCouriers": o_get_online_couriers_owner(db, owner_id),
-                "busyCouriers": o_get_busy_couriers_owner(db, owner_id),
-                "offlineCouriers": o_get_offline_couriers_owner(db, owner_id),
-                "earnings": o_get_earnings_owner(db, owner_id),
-                "ratings": o_get_ratings_owner(db, owner_id),
-            }
-            try:
-                await websocket.send_json(stats_data)
-            except WebSocketDisconnect:
-                print("WebSocket disconnected")
-                break
-            await asyncio.sleep(5)
-    except Exception as e:
-        print(f"Error: {e}")
-    finally:
-        db.close()
+    await stream_snapshots(websocket, owner_stats_broadcaster, owner_id)
 
 
 # WebSocket endpoint for real-time statistics specific to a courier
@@ -377,41 +354,12 @@ async def websocket_courier_stats(websocket: WebSocket, user_id: int):
         db.close()
 
 
-# WebSocket endpoint for real-time notifications specific to a user
+# WebSocket endpoint for real-time notifications specific to a user. Sends the latest notifications (or those after
+# last_seen_id when reconnecting) and then only new or changed ones as they are published.
 @app.websocket("/ws/notifications/{user_id}")
-async def websocket_notifications(websocket: WebSocket, user_id: int):
+async def websocket_notifications(websocket: WebSocket, user_id: int, last_seen_id: int = None):
     await websocket.accept()
-    db = SessionLocal()
-    try:
-        while True:
-            notifications_data = {
-                "notifications": [
-                    {
-                        "id": notification.id,
-                        "message": notification.message,
-                        "read": notification.read,
-                        "created_at": (
-                            notification.created_at.isoformat()
-                            if notification.created_at
-                            else None
-                        ),
-                    }
-                    for notification in get_notifications(db, user_id)
-                ]
-            }
-
-            try:
-                await websocket.send_json(notifications_data)
-            except WebSocketDisconnect:
-                print(f"WebSocket disconnected for user {user_id}")
-                break
-
-            await asyncio.sleep(5)
-
-    except Exception as e:
-        print(f"Error: {e}")
-    finally:
-        db.close()
+    await stream_notifications(websocket, user_id, last_seen_id, get_notification_backfill)
 
 @app.post("/upload-image/")
 async def upload_image(
@@ -929,7 +877,7 @@ async def send_message(
     db: Session = Depends(get_db),
 ):
     return await handle_send_message(
-        db, conversation_id, sender_id, receiver_id, message, connections
+        db, conversation_id, sender_id, receiver_id, message, chat_rooms
     )
 
 
@@ -957,6 +905,18 @@ async def search_items_route(
     return await search_items(db, query.query)
 
 
+# Get the restaurants that deliver to a location, optionally filtered by category and open now
+@app.get("/api/restaurants/deliver-here")
+async def get_restaurants_delivering_here_route(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    category: str = None,
+    open_now: bool = False,
+    db: Session = Depends(get_db),
+):
+    return await get_restaurants_delivering_here(db, latitude, longitude, category, open_now)
+
+
 # Get restaurant details by restaurant name
 @app.get("/api/restaurants/{restaurant_name}/details")
 async def get_restaurant_details_route(
@@ -975,8 +935,10 @@ async def get_restaurant_menu_route(
 
 # Create a new order
 @app.post("/order/")
-async def create_order_route(order: OrderCreate, db: Session = Depends(get_db)):
-    return await create_order(db, order)
+async def create_order_route(
+    order: OrderCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)
+):
+    return await create_order(db, order, background_tasks)
 
 
 # Get the status of a courier by ID
@@ -1065,6 +1027,28 @@ async def top_restaurants(db: Session = Depends(get_db)):
     return await get_top_restaurants(db)
 
 
+# Dispatch metrics for administrators: routing pairs pruned by the straight-line bound, route cache and change index
+@app.get("/api/dispatch/metrics")
+async def dispatch_metrics(current_user: User = Depends(get_current_user)):
+    if current_user.role != "administrator":
+        raise HTTPException(status_code=403, detail="Only administrators can view dispatch metrics")
+
+    return {
+        "dispatchTicks": dispatch_queue.ticks,
+        "routing": dict(routing_metrics),
+        "routeCache": route_cache.stats(),
+        "changeIndex": change_index.stats(),
+        "deliveryZoneIndex": delivery_zone_index.stats(),
+        "geocoding": geocoding_service.stats(),
+        "adminStats": admin_stats_broadcaster.stats(),
+        "ownerStats": owner_stats_broadcaster.stats(),
+        "notifications": notification_hub.stats(),
+        "unreadMessages": unread_counters.stats(),
+        "chat": chat_rooms.stats(),
+        "broadcast": broadcast.stats(),
+    }
+
+
 # Mark a notification as read by its ID
 @app.put("/notifications/{notification_id}/read")
 async def mark_notification_as_read(notification_id: int, db: Session = Depends(get_db)):
@@ -1074,10 +1058,4 @@ async def mark_notification_as_read(notification_id: int, db: Session = Depends(
 # Mark a conversation as read by conversation ID
 @app.post("/conversations/{conversation_id}/mark_as_read")
 async def mark_conversation_as_read(conversation_id: int, user_id: int, db: Session = Depends(get_db)):
-    db.query(Chat).filter(
-        Chat.conversation_id == conversation_id,
-        Chat.receiver_id == user_id,
-        Chat.is_seen == False
-    ).update({"is_seen": True})
-    db.commit()
-    return {"message": "Conversation marked as read"}
+    return await mark_conversation_read(db, conversation_id, user_id)
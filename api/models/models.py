@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Text, Enum, Time, LargeBinary
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Text, Enum, Time, LargeBinary, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database.database import Base
 import datetime
@@ -184,12 +184,20 @@ class Order(Base):
     contact = Column(String, nullable=False)
     payment_method = Column(Enum(PaymentMethod), nullable=False)
     money = Column(Text, nullable=False)
+    # Computed from the order items when the order is created, so queueing and dispatch do not re-aggregate them
+    contains_alcohol = Column(Boolean, nullable=True)
+    total_weight = Column(Float, nullable=True)
+    max_prep_time = Column(Integer, nullable=True)
+    item_count = Column(Integer, nullable=True)
+    # Whether the typed address matches the delivery coordinates; None while a client-supplied pin is being verified
+    location_verified = Column(Boolean, nullable=True)
 
     customer = relationship("User", back_populates="orders")
     restaurant = relationship("Restaurant", back_populates="orders")
     order_items = relationship("OrderItem", back_populates="order")
     order_assignments = relationship("OrderAssignment", back_populates="order")
     ratings = relationship("Rating", back_populates="order")
+    cash_notes = relationship("OrderCashNote", back_populates="order")
 
 # Model for storing order items
 class OrderItem(Base):
@@ -218,6 +226,7 @@ class Courier(Base):
     user = relationship("User", back_populates="couriers")
     restaurant = relationship("Restaurant", back_populates="couriers")
     order_assignments = relationship("OrderAssignment", back_populates="courier")
+    wallet_notes = relationship("WalletNote", back_populates="courier")
 
 # Model for assigning orders to couriers
 class OrderAssignment(Base):
@@ -234,6 +243,40 @@ class OrderAssignment(Base):
 
     order = relationship("Order", back_populates="order_assignments")
     courier = relationship("Courier", back_populates="order_assignments")
+    change_notes = relationship("ChangeNote", back_populates="assignment")
+
+# Model for the notes in a courier's wallet, one row per denomination stored in integer cents
+class WalletNote(Base):
+    __tablename__ = "wallet_notes"
+    __table_args__ = (UniqueConstraint("courier_id", "denomination"),)
+    id = Column(Integer, primary_key=True, index=True)
+    courier_id = Column(Integer, ForeignKey("couriers.id"), nullable=False, index=True)
+    denomination = Column(Integer, nullable=False)
+    quantity = Column(Integer, nullable=False, default=0)
+
+    courier = relationship("Courier", back_populates="wallet_notes")
+
+# Model for the notes a customer pays a cash order with, denominations in integer cents
+class OrderCashNote(Base):
+    __tablename__ = "order_cash_notes"
+    __table_args__ = (UniqueConstraint("order_id", "denomination"),)
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
+    denomination = Column(Integer, nullable=False)
+    quantity = Column(Integer, nullable=False)
+
+    order = relationship("Order", back_populates="cash_notes")
+
+# Model for the notes a courier returns as change for an assignment, denominations in integer cents
+class ChangeNote(Base):
+    __tablename__ = "change_notes"
+    __table_args__ = (UniqueConstraint("assignment_id", "denomination"),)
+    id = Column(Integer, primary_key=True, index=True)
+    assignment_id = Column(Integer, ForeignKey("order_assignments.id"), nullable=False, index=True)
+    denomination = Column(Integer, nullable=False)
+    quantity = Column(Integer, nullable=False)
+
+    assignment = relationship("OrderAssignment", back_populates="change_notes")
 
 # Model for storing restaurant and courier ratings
 class Rating(Base):
@@ -271,6 +314,8 @@ class OrderQueue(Base):
     status = Column(Enum(OrderQueueStatusEnum), nullable=False, default=OrderQueueStatusEnum.pending)
     estimated_preparation_time = Column(DateTime, nullable=False)
     weight = Column(Float, nullable=False, default=0.0)
+    # When dispatch last claimed the entry without assigning it; entries never tried are claimed first
+    last_attempted_at = Column(DateTime, nullable=True)
 
     order = relationship("Order")
 
@@ -341,3 +386,11 @@ class Notification(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     user = relationship("User", back_populates="notifications")
+
+# Model for caching geocoded delivery addresses, keyed by the normalized address
+class GeocodedAddress(Base):
+    __tablename__ = "geocoded_addresses"
+    address = Column(String, primary_key=True)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
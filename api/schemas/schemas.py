@@ -168,6 +168,9 @@ class OrderCreate(BaseModel):
     restaurant_id: int
     total_price: float
     delivery_address: str
+    # Map pin of the delivery address; when given, checkout skips geocoding and the address is verified afterwards
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
     cutlery_included: Optional[bool] = None
     contact: str
     payment_method: str
@@ -272,3 +275,15 @@ class StatusUpdateRequest(BaseModel):
 # Schema for updating the status of an order
 class UpdateOrderStatusSchema(BaseModel):
     status: UpdateOrderStatusEnum
+
+# Schema for the admin dashboard statistics pushed over /ws/admin-stats
+class AdminStatsSnapshot(BaseModel):
+    pendingOrders: int
+    preparingOrders: int
+    inDeliveryOrders: int
+    onlineCouriers: int
+    busyCouriers: int
+    offlineCouriers: int
+    openRestaurants: int
+    closingSoonRestaurants: int
+    closedRestaurants: int
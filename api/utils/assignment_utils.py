@@ -0,0 +1,66 @@
+import numpy as np
+
+# Cost used for pairs that must not be matched; any real cost has to stay far below it
+INFEASIBLE_COST = 1e9
+
+# Solves the minimum-cost bipartite matching (Hungarian algorithm with potentials) of a rows x columns cost matrix.
+# Returns (row, column) pairs; when the matrix is not square the larger side keeps some rows/columns unmatched.
+# Pairs that could only be matched at INFEASIBLE_COST are left out.
+def solve_min_cost_assignment(cost_matrix) -> list[tuple[int, int]]:
+    cost = np.asarray(cost_matrix, dtype=float)
+    if cost.size == 0:
+        return []
+
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+
+    rows, columns = cost.shape
+    u = np.zeros(rows + 1)
+    v = np.zeros(columns + 1)
+    # match[j] is the 1-based row matched to 1-based column j, 0 when column j is free
+    match = np.zeros(columns + 1, dtype=int)
+    way = np.zeros(columns + 1, dtype=int)
+
+    for row in range(1, rows + 1):
+        match[0] = row
+        current_column = 0
+        min_reduced = np.full(columns + 1, np.inf)
+        used = np.zeros(columns + 1, dtype=bool)
+
+        # Grow a shortest augmenting path from the new row until it reaches a free column
+        while True:
+            used[current_column] = True
+            current_row = match[current_column]
+
+            reduced = cost[current_row - 1] - u[current_row] - v[1:]
+            improves = ~used[1:] & (reduced < min_reduced[1:])
+            min_reduced[1:][improves] = reduced[improves]
+            way[1:][improves] = current_column
+
+            candidates = np.where(used[1:], np.inf, min_reduced[1:])
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+
+            u[match[used]] += delta
+            v[used] -= delta
+            min_reduced[~used] -= delta
+
+            current_column = next_column
+            if match[current_column] == 0:
+                break
+
+        # Flip the augmenting path
+        while current_column:
+            previous_column = way[current_column]
+            match[current_column] = match[previous_column]
+            current_column = previous_column
+
+    pairs = []
+    for column in range(1, columns + 1):
+        row = match[column]
+        if row == 0 or cost[row - 1, column - 1] >= INFEASIBLE_COST:
+            continue
+        pairs.append((column - 1, row - 1) if transposed else (row - 1, column - 1))
+
+    return sorted(pairs)
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import zlib
+import queue
+import select
+import threading
+from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
+from database.database import SQLALCHEMY_DATABASE_URL
+
+load_dotenv()
+
+# 'memory' delivers realtime messages within this process only; 'postgres' relays them between every worker and
+# host connected to the same database through LISTEN/NOTIFY
+BROADCAST_BACKEND = os.getenv('BROADCAST_BACKEND', 'memory')
+# The single Postgres channel every worker listens on; messages carry their logical channel in the payload
+BROADCAST_PG_CHANNEL = os.getenv('BROADCAST_PG_CHANNEL', 'food_express_broadcast')
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+BROADCAST_MAX_PAYLOAD = 7900
+# How many messages may wait for the Postgres writer thread before new ones are dropped
+BROADCAST_PUBLISH_QUEUE_SIZE = int(os.getenv('BROADCAST_PUBLISH_QUEUE_SIZE', 10000))
+
+# Broadcast backends hand JSON messages published on a channel (e.g. "chat" or "notifications") to the handlers
+# every process subscribed to that channel. Handlers may run on any thread and must be thread-safe; messages pass
+# through JSON on every backend, so handlers see the same types whichever one is configured.
+class InMemoryBroadcastBackend:
+    name = "memory"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.handlers = {}
+        self.counters = {
+            "published": 0,
+            "received": 0,
+            "dropped": 0,
+            "handler_errors": 0,
+        }
+
+    def subscribe(self, channel: str, handler):
+        with self.lock:
+            self.handlers.setdefault(channel, []).append(handler)
+
+    def _dispatch(self, channel: str, message):
+        with self.lock:
+            handlers = list(self.handlers.get(channel, ()))
+            self.counters["received"] += 1
+        for handler in handlers:
+            try:
+                handler(message)
+            except Exception as e:
+                self.counters["handler_errors"] += 1
+                print(f"Error while handling a {channel} broadcast: {e}")
+
+    def publish(self, channel: str, message):
+        with self.lock:
+            self.counters["published"] += 1
+        self._dispatch(channel, json.loads(json.dumps(message)))
+
+    # Only one process can run a singleton job such as a statistics producer; in memory that is always this one
+    def try_lead(self, name: str) -> bool:
+        return True
+
+    def resign(self, name: str):
+        pass
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.counters,
+                "backend": self.name,
+                "channels": len(self.handlers),
+            }
+
+# Relays messages between processes through Postgres LISTEN/NOTIFY: publish() only queues the message, a writer
+# thread sends it with pg_notify on its own connection, and a listener thread per process hands every notification
+# (its own included) to the local handlers. Publishing never blocks the caller, so async handlers and the dispatch
+# tick can publish directly. Leadership of singleton jobs is a session-level advisory lock, released by Postgres if
+# the process dies.
+class PostgresBroadcastBackend(InMemoryBroadcastBackend):
+    name = "postgres"
+
+    def __init__(self, database_url: str, channel: str, publish_queue_size: int):
+        super().__init__()
+        self.dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self.publish_queue = queue.Queue(maxsize=publish_queue_size)
+        self.writer = None
+        self.lead_lock = threading.Lock()
+        self.lead_connection = None
+        self.leading = set()
+        self.listener = None
+        self.counters.update({"reconnects": 0, "oversized": 0})
+
+    def _connect(self):
+        import psycopg2
+
+        connection = psycopg2.connect(self.dsn)
+        connection.autocommit = True
+        return connection
+
+    # The listener starts with the first subscription, so processes that only publish never hold a connection for it
+    def subscribe(self, channel: str, handler):
+        super().subscribe(channel, handler)
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self._listen, name="broadcast-listener", daemon=True)
+                self.listener.start()
+
+    def _listen(self):
+        while True:
+            connection = None
+            try:
+                connection = self._connect()
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                while True:
+                    if select.select([connection], [], [], 5) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        envelope = json.loads(notification.payload)
+                        self._dispatch(envelope["channel"], envelope["message"])
+            except Exception as e:
+                self.counters["reconnects"] += 1
+                print(f"Broadcast listener lost its connection, reconnecting: {e}")
+                time.sleep(1)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    # Queues the message for the writer thread, which starts with the first publish
+    def publish(self, channel: str, message):
+        payload = json.dumps({"channel": channel, "message": message})
+        if len(payload.encode("utf-8")) > BROADCAST_MAX_PAYLOAD:
+            # Too large for NOTIFY: at least this worker's sockets receive it
+            with self.lock:
+                self.counters["oversized"] += 1
+            print(f"A {channel} broadcast of {len(payload)} characters is too large for NOTIFY, delivering it locally")
+            self._dispatch(channel, json.loads(payload)["message"])
+            return
+
+        with self.lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._write, name="broadcast-writer", daemon=True)
+                self.writer.start()
+        try:
+            self.publish_queue.put_nowait((channel, payload))
+        except queue.Full:
+            with self.lock:
+                self.counters["dropped"] += 1
+            print(f"The broadcast publish queue is full, dropping a {channel} broadcast")
+
+    # Sends queued messages in order, reconnecting once per message when the connection was lost
+    def _write(self):
+        connection = None
+        while True:
+            channel, payload = self.publish_queue.get()
+            for attempt in range(2):
+                try:
+                    if connection is None or connection.closed:
+                        connection = self._connect()
+                    with connection.cursor() as cursor:
+                        cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+                    with self.lock:
+                        self.counters["published"] += 1
+                    break
+                except Exception as e:
+                    if connection is not None:
+                        connection.close()
+                    connection = None
+                    if attempt == 1:
+                        with self.lock:
+                            self.counters["dropped"] += 1
+                        print(f"Error while publishing a {channel} broadcast: {e}")
+
+    # Advisory lock keys are 64-bit integers, derived from the job name
+    def _lock_key(self, name: str) -> int:
+        return zlib.crc32(f"{self.channel}:{name}".encode("utf-8"))
+
+    def try_lead(self, name: str) -> bool:
+        with self.lead_lock:
+            try:
+                if self.lead_connection is None or self.lead_connection.closed:
+                    # Locks held by a lost connection are gone with it
+                    self.leading.clear()
+                    self.lead_connection = self._connect()
+                if name in self.leading:
+                    return True
+                with self.lead_connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_try_advisory_lock(%s)", (self._lock_key(name),))
+                    if cursor.fetchone()[0]:
+                        self.leading.add(name)
+                        return True
+                return False
+            except Exception as e:
+                self.lead_connection = None
+                self.leading.clear()
+                print(f"Error while taking the lead of {name}: {e}")
+                return False
+
+    def resign(self, name: str):
+        with self.lead_lock:
+            if name not in self.leading:
+                return
+            self.leading.discard(name)
+            try:
+                with self.lead_connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", (self._lock_key(name),))
+            except Exception as e:
+                print(f"Error while resigning the lead of {name}: {e}")
+
+    def stats(self):
+        stats = super().stats()
+        stats["publish_queue"] = self.publish_queue.qsize()
+        with self.lead_lock:
+            stats["leading"] = sorted(self.leading)
+        return stats
+
+# Creates the broadcast backend for a backend name
+def make_broadcast_backend(backend: str):
+    if backend == "memory":
+        return InMemoryBroadcastBackend()
+    if backend == "postgres":
+        return PostgresBroadcastBackend(SQLALCHEMY_DATABASE_URL, BROADCAST_PG_CHANNEL, BROADCAST_PUBLISH_QUEUE_SIZE)
+    raise ValueError(f"Unknown broadcast backend: {backend}")
+
+
+broadcast = make_broadcast_backend(BROADCAST_BACKEND)
@@ -0,0 +1,79 @@
+import threading
+from utils.change_utils import split_note_count
+
+# Adds notes ({cents: quantity}) to a reachability bitset, where bit k set means k cents can be paid exactly
+def add_to_bitset(bits: int, notes: dict[int, int]) -> int:
+    for cents, quantity in notes.items():
+        for bundle in split_note_count(quantity):
+            bits |= bits << (bundle * cents)
+    return bits
+
+# Builds the bitset of every amount in cents the notes can pay exactly; the empty sum (0 cents) is always reachable
+def build_bitset(notes: dict[int, int]) -> int:
+    return add_to_bitset(1, notes)
+
+# Canonical, comparable form of a wallet's notes, ignoring denominations with no notes left
+def wallet_version(notes: dict[int, int]):
+    return tuple(sorted((cents, quantity) for cents, quantity in notes.items() if quantity > 0))
+
+# Per-courier bitsets of reachable change amounts. Every entry remembers the wallet notes it was built from and is
+# rebuilt when the courier's current notes differ, so a wallet changed elsewhere is never answered stale.
+class ChangeIndex:
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.counters = {
+            "hits": 0,
+            "builds": 0,
+            "incremental_updates": 0,
+        }
+
+    # Returns the courier's bitset, building it when missing or stale
+    def get(self, courier_id: int, notes: dict[int, int]) -> int:
+        version = wallet_version(notes)
+        with self.lock:
+            entry = self.entries.get(courier_id)
+            if entry is not None and entry[0] == version:
+                self.counters["hits"] += 1
+                return entry[1]
+
+            bits = build_bitset(notes)
+            self.entries[courier_id] = (version, bits)
+            self.counters["builds"] += 1
+            return bits
+
+    # Answers "can this courier return exactly this change (in cents)?" with one bit test
+    def can_return(self, courier_id: int, notes: dict[int, int], required_cents: int) -> bool:
+        if required_cents < 0:
+            return False
+        return bool(self.get(courier_id, notes) >> required_cents & 1)
+
+    # Records notes added to a wallet. The bitset is extended in place when it was built from the previous notes;
+    # otherwise it is rebuilt from the new ones.
+    def add_notes(self, courier_id: int, previous_notes: dict[int, int], new_notes: dict[int, int], added: dict[int, int]):
+        with self.lock:
+            entry = self.entries.get(courier_id)
+            if entry is not None and entry[0] == wallet_version(previous_notes):
+                self.entries[courier_id] = (wallet_version(new_notes), add_to_bitset(entry[1], added))
+                self.counters["incremental_updates"] += 1
+                return
+
+            self.entries[courier_id] = (wallet_version(new_notes), build_bitset(new_notes))
+            self.counters["builds"] += 1
+
+    # Records a wallet whose notes were removed; reachability cannot be subtracted, so the bitset is rebuilt
+    def rebuild(self, courier_id: int, notes: dict[int, int]):
+        with self.lock:
+            self.entries[courier_id] = (wallet_version(notes), build_bitset(notes))
+            self.counters["builds"] += 1
+
+    def invalidate(self, courier_id: int):
+        with self.lock:
+            self.entries.pop(courier_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, "size": len(self.entries)}
+
+
+change_index = ChangeIndex()
@@ -1,49 +1,124 @@
 import json
+import math
+import numpy as np
 
 DENOMINATIONS = [200, 100, 50, 20, 10, 5, 2, 1, 0.50, 0.20, 0.10, 0.05]
 
-# Determines if the courier can return the required change and provides the optimal denominations to return if possible
-def get_optimal_change(required_change: float, courier_wallet: str) -> tuple[bool, list]:
-    money_data = json.loads(courier_wallet)
-
-    available_denominations = []
-    for denomination, quantity in money_data.items():
-        available_denominations.extend([round(float(denomination[:-3]), 2)] * quantity)
-    available_denominations.sort(reverse=True)
-
-    print(f"Available denominations after sorting: {available_denominations}")
-
-    total_available = sum(available_denominations)
-    print(f"Total available amount: {total_available}, Required change: {required_change}")
-
-    if total_available < required_change:
-        print("Insufficient funds to return the required change.")
-        return False, None
-
-    change_to_return = {}
-    remaining_change = round(required_change, 2)
-    print(f"Starting with remaining change: {remaining_change}")
-
-    for coin in available_denominations:
-        print(f"Trying to use denomination: {coin}")
-        while remaining_change >= coin:
-            remaining_change = round(remaining_change - coin, 2)
-            key = f"{int(coin)}BAM"
-            change_to_return[key] = change_to_return.get(key, 0) + 1
-
-        if remaining_change == 0:
-            print("Exact change can be returned.")
-            break
-
-    if remaining_change == 0:
-        formatted_change_to_return = [f"{key} x {quantity}" for key, quantity in change_to_return.items()]
-        return True, formatted_change_to_return
-    else:
-        print("Cannot return exact change.")
-        return False, None
-
-# Calculates the amount of change required based on the order total and the payment amount provided
-def calculate_required_change(order_total, payment_amount):
-    required_change = payment_amount - order_total
-    print(f"Calculated required change: {required_change} from payment amount: {payment_amount} and order total: {order_total}")
-    return required_change
+# Converts an amount in BAM to integer cents, so change is never computed on floats
+def to_cents(amount) -> int:
+    return int(round(float(amount) * 100))
+
+# Formats a denomination in cents as a wallet key: 5000 -> "50BAM", 50 -> "0.50BAM"
+def denomination_key(cents: int) -> str:
+    if cents % 100 == 0:
+        return f"{cents // 100}BAM"
+    return f"{cents / 100:.2f}BAM"
+
+# Parses a wallet or payment JSON ({"50BAM": 2, "0.50BAM": 3}) into {cents: quantity}; empty or missing JSON has no
+# notes. Raises ValueError for anything else, including JSON of another shape such as "[50]" or {"50BAM": null}.
+def parse_notes(money_json: str) -> dict[int, int]:
+    notes = {}
+    if not money_json:
+        return notes
+
+    money = json.loads(money_json)
+    if not isinstance(money, dict):
+        raise ValueError(f"Expected an object of denominations, got {type(money).__name__}")
+
+    for denomination, quantity in money.items():
+        if isinstance(quantity, bool) or not isinstance(quantity, (int, float, str)):
+            raise ValueError(f"Invalid quantity of {denomination}: {quantity!r}")
+        try:
+            quantity = int(quantity)
+            if quantity > 0:
+                cents = to_cents(denomination[:-3])
+                notes[cents] = notes.get(cents, 0) + quantity
+        except OverflowError:
+            raise ValueError(f"Invalid amount of {denomination}: {quantity!r}")
+    return notes
+
+# Formats {cents: quantity} back into the wallet JSON kept on couriers, largest denomination first
+def format_notes(notes: dict[int, int]) -> str:
+    return json.dumps({
+        denomination_key(cents): quantity
+        for cents, quantity in sorted(notes.items(), reverse=True)
+        if quantity > 0
+    })
+
+# Formats {cents: quantity} as the change list stored on assignments, e.g. ["50BAM x 1", "0.50BAM x 2"]
+def format_change(change: dict[int, int]) -> list[str]:
+    return [
+        f"{denomination_key(cents)} x {quantity}"
+        for cents, quantity in sorted(change.items(), reverse=True)
+    ]
+
+# Parses a stored change list JSON ('["50BAM x 1"]') into {cents: quantity}
+def parse_change(optimal_change: str) -> dict[int, int]:
+    change = {}
+    if not optimal_change:
+        return change
+
+    for entry in json.loads(optimal_change):
+        denomination, quantity = entry.split(" x ")
+        cents = to_cents(denomination[:-3])
+        change[cents] = change.get(cents, 0) + int(quantity)
+    return change
+
+# Splits a note count into bundles of 1, 2, 4, ... and a remainder; every count up to it is a sum of distinct bundles,
+# which turns the bounded knapsack into a 0/1 knapsack over a logarithmic number of bundles
+def split_note_count(quantity: int) -> list[int]:
+    bundles = []
+    size = 1
+    while quantity > 0:
+        bundle = min(size, quantity)
+        bundles.append(bundle)
+        quantity -= bundle
+        size *= 2
+    return bundles
+
+# Finds the fewest notes from the wallet ({cents: quantity}) adding up exactly to the amount in cents.
+# Returns {cents: quantity}, or None when exact change cannot be made.
+def solve_change(amount_cents: int, notes: dict[int, int]):
+    if amount_cents < 0:
+        return None
+    if amount_cents == 0:
+        return {}
+
+    notes = {cents: quantity for cents, quantity in notes.items() if quantity > 0 and cents <= amount_cents}
+    if sum(cents * quantity for cents, quantity in notes.items()) < amount_cents:
+        return None
+
+    # Work in multiples of the greatest common divisor (5 cents for the BAM denominations) to keep the table small
+    unit = math.gcd(amount_cents, *notes)
+    target = amount_cents // unit
+
+    # min_notes[a] is the fewest notes adding up to a units; taken[i][a] records whether bundle i was used for it
+    min_notes = np.full(target + 1, np.inf)
+    min_notes[0] = 0
+    bundles = []
+    taken = []
+
+    for cents, quantity in sorted(notes.items(), reverse=True):
+        size = cents // unit
+        for bundle in split_note_count(min(quantity, target // size)):
+            shift = bundle * size
+            candidate = min_notes[:-shift] + bundle
+            improves = candidate < min_notes[shift:]
+            min_notes[shift:][improves] = candidate[improves]
+
+            used = np.zeros(target + 1, dtype=bool)
+            used[shift:] = improves
+            bundles.append((cents, bundle, shift))
+            taken.append(used)
+
+    if not np.isfinite(min_notes[target]):
+        return None
+
+    change = {}
+    remaining = target
+    for (cents, bundle, shift), used in zip(reversed(bundles), reversed(taken)):
+        if used[remaining]:
+            change[cents] = change.get(cents, 0) + bundle
+            remaining -= shift
+
+    return change
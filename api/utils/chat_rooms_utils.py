@@ -0,0 +1,59 @@
+import threading
+from fastapi.websockets import WebSocket
+from utils.broadcast_backend_utils import broadcast
+from utils.connection_manager_utils import (
+    ConnectionManager,
+    ManagedConnection,
+    WS_SEND_QUEUE_SIZE,
+    WS_SLOW_CONSUMER_POLICY,
+    WS_SEND_TIMEOUT,
+    WS_HEARTBEAT_INTERVAL,
+    WS_IDLE_TIMEOUT,
+)
+
+# Chat sockets grouped by conversation. Frames are published through the broadcast backend, so participants whose
+# sockets live on another worker receive them too; each worker queues them for its own sockets in the connection
+# manager, where a slow socket never holds up the rest of the conversation.
+class ChatRooms:
+    def __init__(self, backend, connections: ConnectionManager):
+        self.backend = backend
+        self.connections = connections
+        self.lock = threading.Lock()
+        self.counters = {
+            "published": 0,
+        }
+
+    def join(self, conversation_id: int, websocket: WebSocket) -> ManagedConnection:
+        return self.connections.connect(conversation_id, websocket)
+
+    def leave(self, connection: ManagedConnection):
+        self.connections.disconnect(connection)
+
+    def touch(self, connection: ManagedConnection):
+        self.connections.touch(connection)
+
+    # Sends a text frame to every participant of the conversation, on any worker
+    def publish(self, conversation_id: int, text: str):
+        with self.lock:
+            self.counters["published"] += 1
+        self.backend.publish("chat", {"conversation_id": conversation_id, "text": text})
+
+    # Broadcast handler: queues the frame for each local socket in the conversation
+    def receive(self, message: dict):
+        self.connections.send(message["conversation_id"], message["text"])
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, **self.connections.stats()}
+
+
+chat_connections = ConnectionManager(
+    "chat",
+    WS_SEND_QUEUE_SIZE,
+    WS_SLOW_CONSUMER_POLICY,
+    WS_SEND_TIMEOUT,
+    WS_HEARTBEAT_INTERVAL,
+    WS_IDLE_TIMEOUT,
+)
+chat_rooms = ChatRooms(broadcast, chat_connections)
+broadcast.subscribe("chat", chat_rooms.receive)
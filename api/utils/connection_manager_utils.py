@@ -0,0 +1,166 @@
+import os
+import time
+import asyncio
+import threading
+from dotenv import load_dotenv
+from fastapi.websockets import WebSocket, WebSocketState
+
+load_dotenv()
+
+# How many outbound frames a socket may have waiting before it counts as a slow consumer
+WS_SEND_QUEUE_SIZE = int(os.getenv('WS_SEND_QUEUE_SIZE', 64))
+# 'close' disconnects a slow consumer so it reloads on reconnect, 'drop_oldest' skips its oldest waiting frame
+WS_SLOW_CONSUMER_POLICY = os.getenv('WS_SLOW_CONSUMER_POLICY', 'close')
+# A single frame that takes longer than this to send closes the socket
+WS_SEND_TIMEOUT = float(os.getenv('WS_SEND_TIMEOUT', 10))
+# Every interval each socket is sent a heartbeat; one that sent nothing back for WS_IDLE_TIMEOUT is reaped
+WS_HEARTBEAT_INTERVAL = float(os.getenv('WS_HEARTBEAT_INTERVAL', 20))
+WS_IDLE_TIMEOUT = float(os.getenv('WS_IDLE_TIMEOUT', 60))
+
+HEARTBEAT_FRAME = '{"type": "ping"}'
+
+# One managed socket: frames wait in its bounded queue and its own writer task sends them
+class ManagedConnection:
+    def __init__(self, group, websocket: WebSocket, loop, queue_size: int):
+        self.group = group
+        self.websocket = websocket
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.writer = None
+        self.last_seen = time.monotonic()
+        self.closed = False
+
+# Groups sockets (e.g. by conversation) and sends to them without one socket holding up another: send() only
+# enqueues, a writer task per socket drains its queue, and a socket that cannot keep up is handled by the slow
+# consumer policy. A reaper sends heartbeats and closes sockets that stayed silent for too long.
+class ConnectionManager:
+    def __init__(self, name: str, queue_size: int, policy: str, send_timeout: float, heartbeat_interval: float, idle_timeout: float):
+        if policy not in ("close", "drop_oldest"):
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.name = name
+        self.queue_size = queue_size
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.groups = {}
+        self.reaper = None
+        self.counters = {
+            "connected": 0,
+            "sent": 0,
+            "dropped_frames": 0,
+            "slow_consumers_closed": 0,
+            "send_errors": 0,
+            "reaped": 0,
+        }
+
+    # Registers an accepted socket in its group and starts its writer; must be called on the socket's event loop
+    def connect(self, group, websocket: WebSocket) -> ManagedConnection:
+        connection = ManagedConnection(group, websocket, asyncio.get_running_loop(), self.queue_size)
+        connection.writer = asyncio.ensure_future(self._write(connection))
+        with self.lock:
+            self.groups.setdefault(group, set()).add(connection)
+            self.counters["connected"] += 1
+        if self.reaper is None or self.reaper.done():
+            self.reaper = asyncio.ensure_future(self._reap())
+        return connection
+
+    # Unregisters the socket and stops its writer; frames still waiting are discarded
+    def disconnect(self, connection: ManagedConnection):
+        connection.closed = True
+        with self.lock:
+            connections = self.groups.get(connection.group)
+            if connections is not None:
+                connections.discard(connection)
+                if not connections:
+                    del self.groups[connection.group]
+        if connection.writer is not None and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+
+    # Records that the client is still there; call it for every frame received from the socket
+    def touch(self, connection: ManagedConnection):
+        connection.last_seen = time.monotonic()
+
+    # Queues a text frame for every socket of the group; safe to call from any thread
+    def send(self, group, text: str):
+        with self.lock:
+            connections = list(self.groups.get(group, ()))
+
+        for connection in connections:
+            try:
+                connection.loop.call_soon_threadsafe(self._enqueue, connection, text)
+            except RuntimeError:
+                # The socket's event loop has already closed
+                pass
+
+    def _enqueue(self, connection: ManagedConnection, text: str):
+        if connection.closed:
+            return
+        if connection.queue.full():
+            if self.policy == "close":
+                self.counters["slow_consumers_closed"] += 1
+                self.counters["dropped_frames"] += connection.queue.qsize() + 1
+                self._close(connection, 1013, "Too slow to keep up")
+                return
+            connection.queue.get_nowait()
+            self.counters["dropped_frames"] += 1
+        connection.queue.put_nowait(text)
+
+    async def _write(self, connection: ManagedConnection):
+        while True:
+            text = await connection.queue.get()
+            try:
+                await asyncio.wait_for(connection.websocket.send_text(text), self.send_timeout)
+                self.counters["sent"] += 1
+            except Exception as e:
+                self.counters["send_errors"] += 1
+                print(f"Error while sending to a {self.name} websocket, closing it: {e!r}")
+                self._close(connection, 1011, "Send failed")
+                return
+
+    # Unregisters the socket and closes it in the background; the endpoint's receive loop then ends as usual
+    def _close(self, connection: ManagedConnection, code: int, reason: str):
+        if connection.closed:
+            return
+        self.disconnect(connection)
+        asyncio.ensure_future(self._close_socket(connection.websocket, code, reason))
+
+    async def _close_socket(self, websocket: WebSocket, code: int, reason: str):
+        if websocket.client_state != WebSocketState.CONNECTED:
+            return
+        try:
+            await asyncio.wait_for(websocket.close(code=code, reason=reason), self.send_timeout)
+        except Exception:
+            # The socket is already gone
+            pass
+
+    # Heartbeat loop; runs while any socket is connected
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            with self.lock:
+                connections = [connection for group in self.groups.values() for connection in group]
+            if not connections:
+                return
+
+            now = time.monotonic()
+            for connection in connections:
+                if now - connection.last_seen > self.idle_timeout:
+                    self.counters["reaped"] += 1
+                    self._close(connection, 1001, "Idle timeout")
+                elif not connection.queue.full():
+                    connection.queue.put_nowait(HEARTBEAT_FRAME)
+
+    def stats(self):
+        with self.lock:
+            connections = [connection for group in self.groups.values() for connection in group]
+            depths = [connection.queue.qsize() for connection in connections]
+            return {
+                **self.counters,
+                "policy": self.policy,
+                "groups": len(self.groups),
+                "connections": len(connections),
+                "queued_frames": sum(depths),
+                "max_queue_depth": max(depths, default=0),
+            }
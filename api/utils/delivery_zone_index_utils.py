@@ -0,0 +1,147 @@
+import os
+import math
+import time
+import threading
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from models.models import DeliveryZone, RestaurantDeliveryZone
+from utils.broadcast_backend_utils import broadcast
+
+load_dotenv()
+
+DELIVERY_ZONE_GRID = float(os.getenv('DELIVERY_ZONE_GRID', 0.01))
+# The index is reloaded at least this often, in case a worker missed an invalidation broadcast
+DELIVERY_ZONE_INDEX_TTL = float(os.getenv('DELIVERY_ZONE_INDEX_TTL', 5 * 60))
+
+# Orders a zone's four corners by angle around their centroid, so the quadrilateral is a simple polygon
+# whatever order the corners were entered in. Points are (latitude, longitude).
+def order_zone_points(points):
+    center_latitude = sum(point[0] for point in points) / len(points)
+    center_longitude = sum(point[1] for point in points) / len(points)
+    return sorted(points, key=lambda point: math.atan2(point[0] - center_latitude, point[1] - center_longitude))
+
+# Ray-casting point-in-polygon test; points on an edge count as inside
+def point_in_polygon(latitude: float, longitude: float, polygon) -> bool:
+    inside = False
+    previous_latitude, previous_longitude = polygon[-1]
+
+    for point_latitude, point_longitude in polygon:
+        # On the edge between the previous and the current corner
+        cross = (point_longitude - previous_longitude) * (latitude - previous_latitude) - (point_latitude - previous_latitude) * (longitude - previous_longitude)
+        if (
+            cross == 0
+            and min(previous_latitude, point_latitude) <= latitude <= max(previous_latitude, point_latitude)
+            and min(previous_longitude, point_longitude) <= longitude <= max(previous_longitude, point_longitude)
+        ):
+            return True
+
+        if (point_latitude > latitude) != (previous_latitude > latitude):
+            crossing_longitude = point_longitude + (latitude - point_latitude) * (previous_longitude - point_longitude) / (previous_latitude - point_latitude)
+            if longitude < crossing_longitude:
+                inside = not inside
+
+        previous_latitude, previous_longitude = point_latitude, point_longitude
+
+    return inside
+
+# In-memory index of the delivery zones: every zone is registered in the uniform grid cells its bounding box covers,
+# so a lookup only runs the exact polygon test on the few zones sharing the point's cell. Loaded from the database on
+# first use and dropped by invalidate() whenever zones or restaurant links change, on every worker through the
+# broadcast backend.
+class DeliveryZoneIndex:
+    def __init__(self, grid: float, ttl: float, backend):
+        self.grid = grid
+        self.ttl = ttl
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.loaded_at = 0.0
+        self.polygons = {}
+        self.cells = {}
+        self.zone_restaurants = {}
+        self.counters = {
+            "loads": 0,
+            "lookups": 0,
+            "polygon_tests": 0,
+        }
+
+    def cell(self, latitude: float, longitude: float):
+        return (math.floor(latitude / self.grid), math.floor(longitude / self.grid))
+
+    def _load(self, db: Session):
+        polygons = {}
+        cells = {}
+        zone_restaurants = {}
+
+        for zone in db.query(DeliveryZone).all():
+            polygon = order_zone_points([
+                (zone.point1_latitude, zone.point1_longitude),
+                (zone.point2_latitude, zone.point2_longitude),
+                (zone.point3_latitude, zone.point3_longitude),
+                (zone.point4_latitude, zone.point4_longitude),
+            ])
+            polygons[zone.id] = polygon
+            zone_restaurants[zone.id] = set()
+
+            min_cell = self.cell(min(point[0] for point in polygon), min(point[1] for point in polygon))
+            max_cell = self.cell(max(point[0] for point in polygon), max(point[1] for point in polygon))
+            for cell_latitude in range(min_cell[0], max_cell[0] + 1):
+                for cell_longitude in range(min_cell[1], max_cell[1] + 1):
+                    cells.setdefault((cell_latitude, cell_longitude), []).append(zone.id)
+
+        links = db.query(RestaurantDeliveryZone.restaurant_id, RestaurantDeliveryZone.delivery_zone_id).all()
+        for restaurant_id, zone_id in links:
+            if zone_id in zone_restaurants:
+                zone_restaurants[zone_id].add(restaurant_id)
+
+        self.polygons = polygons
+        self.cells = cells
+        self.zone_restaurants = zone_restaurants
+        self.loaded = True
+        self.loaded_at = time.monotonic()
+        self.counters["loads"] += 1
+        print(f"Loaded delivery zone index: {len(polygons)} zones in {len(cells)} grid cells.")
+
+    # Returns the IDs of the zones containing the point
+    def zones_containing(self, db: Session, latitude: float, longitude: float) -> list[int]:
+        with self.lock:
+            if not self.loaded or time.monotonic() - self.loaded_at > self.ttl:
+                self._load(db)
+
+            self.counters["lookups"] += 1
+            zone_ids = []
+            for zone_id in self.cells.get(self.cell(latitude, longitude), ()):
+                self.counters["polygon_tests"] += 1
+                if point_in_polygon(latitude, longitude, self.polygons[zone_id]):
+                    zone_ids.append(zone_id)
+            return zone_ids
+
+    # Returns the IDs of the restaurants delivering to the point
+    def restaurants_delivering_to(self, db: Session, latitude: float, longitude: float) -> set[int]:
+        zone_ids = self.zones_containing(db, latitude, longitude)
+        with self.lock:
+            restaurant_ids = set()
+            for zone_id in zone_ids:
+                restaurant_ids |= self.zone_restaurants.get(zone_id, set())
+            return restaurant_ids
+
+    def delivers_to(self, db: Session, restaurant_id: int, latitude: float, longitude: float) -> bool:
+        return restaurant_id in self.restaurants_delivering_to(db, latitude, longitude)
+
+    # Drops the index here at once and on the other workers once they receive the broadcast; call after committing
+    def invalidate(self):
+        self.receive({})
+        self.backend.publish("zones", {})
+
+    # Broadcast handler: the next lookup reloads the index
+    def receive(self, message: dict):
+        with self.lock:
+            self.loaded = False
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, "zones": len(self.polygons), "cells": len(self.cells), "loaded": self.loaded}
+
+
+delivery_zone_index = DeliveryZoneIndex(DELIVERY_ZONE_GRID, DELIVERY_ZONE_INDEX_TTL, broadcast)
+broadcast.subscribe("zones", delivery_zone_index.receive)
@@ -0,0 +1,61 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# How long the dispatcher waits after an event for more events to arrive, so a burst is handled by one tick
+DISPATCH_DEBOUNCE_SECONDS = float(os.getenv('DISPATCH_DEBOUNCE_SECONDS', 0.05))
+
+# In-process queue of dispatch events (order accepted, courier online, periodic sweep) drained by one dispatcher thread
+class DispatchQueue:
+    def __init__(self, debounce_seconds: float):
+        self.debounce_seconds = debounce_seconds
+        self.events = queue.Queue()
+        self.handler = None
+        self.thread = None
+        self.loop = None
+        self.ticks = 0
+
+    # Starts the dispatcher thread; the handler is the coroutine function that runs one dispatch tick
+    def start(self, handler):
+        if self.thread is not None:
+            return
+        self.handler = handler
+        # Ticks share one long-lived event loop, so the pooled routing client keeps its connections between ticks
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name="dispatcher", daemon=True)
+        self.thread.start()
+
+    # Records that something happened which may allow new assignments; safe to call from any thread
+    def notify(self, reason: str):
+        if self.thread is None:
+            return
+        self.events.put(reason)
+
+    def _drain(self, first_reason: str):
+        reasons = [first_reason]
+        while True:
+            try:
+                reasons.append(self.events.get_nowait())
+            except queue.Empty:
+                return reasons
+
+    def _run(self):
+        while True:
+            reason = self.events.get()
+            time.sleep(self.debounce_seconds)
+            reasons = self._drain(reason)
+
+            print(f"Dispatch tick triggered by: {', '.join(sorted(set(reasons)))}")
+            try:
+                self.loop.run_until_complete(self.handler())
+            except Exception as e:
+                print(f"Error while dispatching orders: {e}")
+            self.ticks += 1
+
+
+dispatch_queue = DispatchQueue(DISPATCH_DEBOUNCE_SECONDS)
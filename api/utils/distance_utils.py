@@ -1,48 +1,240 @@
 import os
+import random
+import asyncio
+import weakref
+import httpx
 import requests
 from dotenv import load_dotenv
 import openrouteservice
 from openrouteservice import convert
+from utils.route_cache_utils import route_cache
+from utils.offline_routing_utils import calculate_offline_route, calculate_offline_route_matrix
 
 load_dotenv()
 
 OSRM_BASE_URL = os.getenv('OSRM_BASE')
+OSRM_TABLE_MAX_SIZE = int(os.getenv('OSRM_TABLE_MAX_SIZE', 100))
+OSRM_TIMEOUT = float(os.getenv('OSRM_TIMEOUT', 5))
+OSRM_MAX_CONCURRENCY = int(os.getenv('OSRM_MAX_CONCURRENCY', 10))
+OSRM_MAX_RETRIES = int(os.getenv('OSRM_MAX_RETRIES', 3))
+OSRM_RETRY_BACKOFF = float(os.getenv('OSRM_RETRY_BACKOFF', 0.5))
+
+# 'osrm' routes through the OSRM service, 'offline' answers every lookup in-process
+ROUTING_BACKEND = os.getenv('ROUTING_BACKEND', 'osrm')
+# When set to 'offline', lookups that fail against OSRM are answered by the offline engine instead
+ROUTING_FALLBACK = os.getenv('ROUTING_FALLBACK', '')
+
+# One pooled client and concurrency limit per event loop, since asyncio primitives cannot be shared across loops
+_async_clients = weakref.WeakKeyDictionary()
+
+# Switches the routing backend at runtime, e.g. for load tests
+def set_routing_backend(backend: str, fallback: str = ''):
+    global ROUTING_BACKEND, ROUTING_FALLBACK
+    if backend not in ('osrm', 'offline'):
+        raise ValueError(f"Unknown routing backend: {backend}")
+    ROUTING_BACKEND = backend
+    ROUTING_FALLBACK = fallback
+
+# Decides whether a failed OSRM lookup is answered offline or re-raised
+def _should_fall_back(error):
+    if ROUTING_FALLBACK != 'offline':
+        return False
+    print(f"OSRM lookup failed ({error}), falling back to the offline routing engine")
+    return True
+
+# Builds the OSRM route URL between two (latitude, longitude) coordinates
+def _build_route_url(start_coords, end_coords, profile):
+    return f"{OSRM_BASE_URL}/route/v1/{profile}/{start_coords[1]},{start_coords[0]};{end_coords[1]},{end_coords[0]}?overview=false"
+
+# Extracts (distance in meters, travel time in minutes) from an OSRM route response
+def _parse_route_response(status_code, data):
+    if status_code != 200 or not data.get("routes"):
+        raise Exception(f"Error calculating route: {data.get('message', 'No routes found')}")
+
+    distance_in_meters = data["routes"][0]["distance"]
+    travel_time_minutes = data["routes"][0]["duration"] / 60
+
+    print(f"Calculated route: {distance_in_meters} meters, {travel_time_minutes} minutes")
+    return (distance_in_meters, travel_time_minutes)
+
+# Builds the OSRM table URL for a chunk of pairs, with the row/column of every unique start and end coordinate
+def _build_table_request(pairs, profile):
+    source_rows = {}
+    destination_columns = {}
+    for start_coords, end_coords in pairs:
+        source_rows.setdefault(start_coords, len(source_rows))
+        destination_columns.setdefault(end_coords, len(destination_columns))
+
+    coordinates = list(source_rows) + list(destination_columns)
+    coordinates_param = ";".join(f"{coords[1]},{coords[0]}" for coords in coordinates)
+    sources_param = ";".join(str(index) for index in range(len(source_rows)))
+    destinations_param = ";".join(
+        str(len(source_rows) + index) for index in range(len(destination_columns))
+    )
+
+    url = f"{OSRM_BASE_URL}/table/v1/{profile}/{coordinates_param}?sources={sources_param}&destinations={destinations_param}&annotations=distance,duration"
+    return url, source_rows, destination_columns
+
+# Picks the source -> destination cell of every pair from an OSRM table response
+def _parse_table_response(pairs, source_rows, destination_columns, status_code, data):
+    if status_code != 200 or data.get("code") != "Ok":
+        raise Exception(f"Error calculating route matrix: {data.get('message', 'No table returned')}")
+
+    results = []
+    for start_coords, end_coords in pairs:
+        row = source_rows[start_coords]
+        column = destination_columns[end_coords]
+        distance_in_meters = data["distances"][row][column]
+        travel_time_seconds = data["durations"][row][column]
+
+        # OSRM returns null for pairs it cannot route between
+        if distance_in_meters is None or travel_time_seconds is None:
+            results.append(None)
+        else:
+            results.append((distance_in_meters, travel_time_seconds / 60))
+
+    return results
+
+# Splits the pairs the cache cannot answer into chunks that stay within the server's table size limit
+def _split_missing_pairs(pairs, profile):
+    results = [route_cache.get(profile, start_coords, end_coords) for start_coords, end_coords in pairs]
+    missing = [index for index, route in enumerate(results) if route is None]
+
+    print(f"Route cache answered {len(pairs) - len(missing)} of {len(pairs)} pairs")
+
+    # Every pair contributes at most two coordinates to a table request
+    chunk_size = max(OSRM_TABLE_MAX_SIZE // 2, 1)
+    chunks = [missing[start:start + chunk_size] for start in range(0, len(missing), chunk_size)]
+    return results, chunks
+
+# Stores freshly requested routes of a chunk in the results and the route cache
+def _store_chunk_routes(pairs, profile, results, chunk, routes):
+    for index, route in zip(chunk, routes):
+        results[index] = route
+    route_cache.set_many(
+        (profile, pairs[index][0], pairs[index][1], route)
+        for index, route in zip(chunk, routes)
+        if route is not None
+    )
+
+# Calculates the route between two coordinates for the vehicle type (car or bike) using the OSRM service,
+# returning the distance in meters and the travel time in minutes from a single (cached) lookup
+def calculate_route(start_coords, end_coords, vehicle_type):
+    if ROUTING_BACKEND == 'offline':
+        return calculate_offline_route(start_coords, end_coords, vehicle_type)
 
-# Calculates the distance between two coordinates based on the vehicle type (car or bike) using the OSRM service
-def calculate_route_distance(start_coords, end_coords, vehicle_type):
     profile = 'car' if vehicle_type == 'car' else 'bike'
 
-    print(f"Calculating route distance from {start_coords} to {end_coords} using {vehicle_type}")
+    cached_route = route_cache.get(profile, start_coords, end_coords)
+    if cached_route is not None:
+        return cached_route
+
+    print(f"Calculating route from {start_coords} to {end_coords} using {vehicle_type}")
+
+    try:
+        response = requests.get(_build_route_url(start_coords, end_coords, profile), timeout=OSRM_TIMEOUT)
+        route = _parse_route_response(response.status_code, response.json())
+    except Exception as e:
+        if _should_fall_back(e):
+            return calculate_offline_route(start_coords, end_coords, vehicle_type)
+        raise
+
+    route_cache.set(profile, start_coords, end_coords, route)
+    return route
+
+# Returns the keep-alive client and concurrency limit shared by all routing calls on the running event loop
+def _get_async_client():
+    loop = asyncio.get_running_loop()
+    state = _async_clients.get(loop)
+    if state is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(OSRM_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=OSRM_MAX_CONCURRENCY,
+                max_keepalive_connections=OSRM_MAX_CONCURRENCY,
+            ),
+        )
+        state = (client, asyncio.Semaphore(OSRM_MAX_CONCURRENCY))
+        _async_clients[loop] = state
+    return state
+
+# Closes the pooled client of the running event loop
+async def close_async_client():
+    state = _async_clients.pop(asyncio.get_running_loop(), None)
+    if state is not None:
+        await state[0].aclose()
+
+# Sends a GET request to OSRM, retrying timeouts, connection errors and 429/5xx answers with exponential backoff
+async def _async_get_json(url):
+    client, semaphore = _get_async_client()
+
+    for attempt in range(OSRM_MAX_RETRIES + 1):
+        try:
+            async with semaphore:
+                response = await client.get(url)
+            if response.status_code != 429 and response.status_code < 500:
+                return response.status_code, response.json()
+            error = Exception(f"OSRM responded with status {response.status_code}")
+        except httpx.TransportError as e:
+            error = e
+
+        if attempt == OSRM_MAX_RETRIES:
+            raise Exception(f"Error contacting OSRM after {attempt + 1} attempts: {error}")
+
+        delay = OSRM_RETRY_BACKOFF * (2 ** attempt) * (1 + random.random())
+        print(f"OSRM request failed ({error}), retrying in {delay:.2f} seconds")
+        await asyncio.sleep(delay)
+
+# Async version of calculate_route that does not block the event loop
+async def async_calculate_route(start_coords, end_coords, vehicle_type):
+    if ROUTING_BACKEND == 'offline':
+        return calculate_offline_route(start_coords, end_coords, vehicle_type)
+
+    profile = 'car' if vehicle_type == 'car' else 'bike'
 
-    url = f"{OSRM_BASE_URL}/route/v1/{profile}/{start_coords[1]},{start_coords[0]};{end_coords[1]},{end_coords[0]}?overview=false"
+    cached_route = route_cache.get(profile, start_coords, end_coords)
+    if cached_route is not None:
+        return cached_route
 
-    response = requests.get(url)
-    data = response.json()
+    print(f"Calculating route from {start_coords} to {end_coords} using {vehicle_type}")
 
-    if response.status_code != 200 or not data.get("routes"):
-        raise Exception(f"Error calculating route distance: {data.get('message', 'No routes found')}")
+    try:
+        status_code, data = await _async_get_json(_build_route_url(start_coords, end_coords, profile))
+        route = _parse_route_response(status_code, data)
+    except Exception as e:
+        if _should_fall_back(e):
+            return calculate_offline_route(start_coords, end_coords, vehicle_type)
+        raise
 
-    distance_in_meters = data["routes"][0]["distance"]
+    route_cache.set(profile, start_coords, end_coords, route)
+    return route
 
-    print(f"Calculated route distance: {distance_in_meters} meters")
-    return distance_in_meters
+# Calculates distances (meters) and travel times (minutes) for many (start, end) pairs with one OSRM table request per chunk,
+# requesting the chunks concurrently
+async def async_calculate_route_matrix(pairs, vehicle_type):
+    if ROUTING_BACKEND == 'offline':
+        return calculate_offline_route_matrix(pairs, vehicle_type)
 
-# Calculates the travel time between a restaurant and a delivery location using the vehicle type (car or bike) with the OSRM service
-def calculate_travel_time(restaurant_coords, delivery_coords, vehicle_type):
     profile = 'car' if vehicle_type == 'car' else 'bike'
 
-    print(f"Calculating travel time from {restaurant_coords} to {delivery_coords} using {vehicle_type}")
-
-    url = f"http://router.project-osrm.org/route/v1/{profile}/{restaurant_coords[1]},{restaurant_coords[0]};{delivery_coords[1]},{delivery_coords[0]}?overview=false"
+    print(f"Calculating route matrix for {len(pairs)} pairs using {vehicle_type}")
 
-    response = requests.get(url)
-    data = response.json()
+    results, chunks = _split_missing_pairs(pairs, profile)
 
-    if response.status_code != 200 or not data.get("routes"):
-        raise Exception(f"Error calculating travel time: {data.get('message', 'No routes found')}")
+    async def request_chunk(chunk):
+        chunk_pairs = [pairs[index] for index in chunk]
+        url, source_rows, destination_columns = _build_table_request(chunk_pairs, profile)
+        try:
+            status_code, data = await _async_get_json(url)
+            routes = _parse_table_response(chunk_pairs, source_rows, destination_columns, status_code, data)
+        except Exception as e:
+            if not _should_fall_back(e):
+                raise
+            for index, route in zip(chunk, calculate_offline_route_matrix(chunk_pairs, vehicle_type)):
+                results[index] = route
+            return
+        _store_chunk_routes(pairs, profile, results, chunk, routes)
 
-    travel_time_seconds = data["routes"][0]["duration"]
-    travel_time_minutes = travel_time_seconds / 60
+    await asyncio.gather(*(request_chunk(chunk) for chunk in chunks))
 
-    print(f"Calculated travel time: {travel_time_minutes} minutes")
-    return travel_time_minutes
+    return results
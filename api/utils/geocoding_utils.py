@@ -0,0 +1,201 @@
+import os
+import re
+import json
+import time
+import asyncio
+import weakref
+import threading
+import unicodedata
+from collections import OrderedDict
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from dotenv import load_dotenv
+from geopy.geocoders import Nominatim
+from models.models import GeocodedAddress
+
+load_dotenv()
+
+# 'nominatim' geocodes through the public Nominatim service, 'offline' answers from a local gazetteer file
+GEOCODER_BACKEND = os.getenv('GEOCODER_BACKEND', 'nominatim')
+GEOCODER_COUNTRY_CODES = os.getenv('GEOCODER_COUNTRY_CODES', 'BA')
+GEOCODER_TIMEOUT = float(os.getenv('GEOCODER_TIMEOUT', 5))
+# Nominatim's usage policy allows at most one request per second
+GEOCODER_MIN_INTERVAL = float(os.getenv('GEOCODER_MIN_INTERVAL', 1))
+# Requests that would wait longer than this for their turn are turned away instead of queueing
+GEOCODER_MAX_WAIT = float(os.getenv('GEOCODER_MAX_WAIT', 30))
+GEOCODER_GAZETTEER_PATH = os.getenv('GEOCODER_GAZETTEER_PATH', 'gazetteer.json')
+GEOCODE_CACHE_SIZE = int(os.getenv('GEOCODE_CACHE_SIZE', 10000))
+# Addresses that could not be located are remembered in memory for this long, so retries do not hit the geocoder
+GEOCODE_MISS_TTL = int(os.getenv('GEOCODE_MISS_TTL', 10 * 60))
+
+# Normalizes an address for cache lookups: case, diacritics, punctuation and whitespace are ignored
+def normalize_address(address: str) -> str:
+    address = unicodedata.normalize("NFKD", address.lower().replace("đ", "dj"))
+    address = "".join(character for character in address if not unicodedata.combining(character))
+    address = re.sub(r"[^\w\s]", " ", address)
+    return " ".join(address.split())
+
+# Spaces geocoder requests at least min_interval seconds apart. Callers reserve the next free slot under a thread lock
+# and sleep until it comes, so the limit holds across event loops and threads and requests are served in order.
+class RateLimiter:
+    def __init__(self, min_interval: float, max_wait: float):
+        self.min_interval = min_interval
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    async def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            if slot - now > self.max_wait:
+                raise HTTPException(status_code=503, detail="Address lookup is busy, please try again shortly.")
+            self.next_slot = slot + self.min_interval
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+# Geocodes addresses through Nominatim, reusing one client and never blocking the event loop
+class NominatimGeocoder:
+    def __init__(self, country_codes: str, timeout: float, rate_limiter: RateLimiter):
+        self.country_codes = country_codes
+        self.rate_limiter = rate_limiter
+        self.client = Nominatim(user_agent="food-express", timeout=timeout)
+
+    async def geocode(self, address: str):
+        await self.rate_limiter.acquire()
+        location = await asyncio.to_thread(self.client.geocode, address, country_codes=self.country_codes)
+        if not location:
+            return None
+        return (location.latitude, location.longitude)
+
+# Geocodes addresses from a JSON gazetteer ({"address": [latitude, longitude]}) for tests and load runs
+class GazetteerGeocoder:
+    def __init__(self, path: str):
+        self.places = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as gazetteer:
+                for address, coords in json.load(gazetteer).items():
+                    self.add(address, coords[0], coords[1])
+
+    def add(self, address: str, latitude: float, longitude: float):
+        self.places[normalize_address(address)] = (latitude, longitude)
+
+    async def geocode(self, address: str):
+        return self.places.get(normalize_address(address))
+
+# Creates the geocoder for a backend name
+def make_geocoder(backend: str, gazetteer_path: str = None):
+    if backend == "offline":
+        return GazetteerGeocoder(gazetteer_path or GEOCODER_GAZETTEER_PATH)
+    if backend == "nominatim":
+        limiter = RateLimiter(GEOCODER_MIN_INTERVAL, GEOCODER_MAX_WAIT)
+        return NominatimGeocoder(GEOCODER_COUNTRY_CODES, GEOCODER_TIMEOUT, limiter)
+    raise ValueError(f"Unknown geocoder backend: {backend}")
+
+# Resolves addresses to (latitude, longitude) through an in-memory LRU, then the geocoded_addresses table, then the
+# configured geocoder. Concurrent lookups of the same address on one event loop share a single geocoder request.
+class GeocodingService:
+    def __init__(self, max_size: int, miss_ttl: int):
+        self.max_size = max_size
+        self.miss_ttl = miss_ttl
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.geocoder = None
+        self.pending = weakref.WeakKeyDictionary()
+        self.counters = {
+            "memory_hits": 0,
+            "table_hits": 0,
+            "geocoder_requests": 0,
+            "not_found": 0,
+        }
+
+    def set_geocoder(self, geocoder):
+        self.geocoder = geocoder
+
+    # Creates the GEOCODER_BACKEND geocoder on first use
+    def get_geocoder(self):
+        if self.geocoder is None:
+            self.geocoder = make_geocoder(GEOCODER_BACKEND)
+        return self.geocoder
+
+    def _remember(self, key, coords, expires_at=None):
+        with self.lock:
+            self.memory[key] = (coords, expires_at)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_size:
+                self.memory.popitem(last=False)
+
+    # Returns (found, coords) from the memory tier; misses are only remembered until they expire
+    def _recall(self, key):
+        with self.lock:
+            cached = self.memory.get(key)
+            if cached is None:
+                return False, None
+            coords, expires_at = cached
+            if expires_at is not None and expires_at <= time.time():
+                del self.memory[key]
+                return False, None
+            self.memory.move_to_end(key)
+            self.counters["memory_hits"] += 1
+            return True, coords
+
+    def _store(self, db: Session, key, coords):
+        try:
+            db.add(GeocodedAddress(address=key, latitude=coords[0], longitude=coords[1]))
+            db.commit()
+        except IntegrityError:
+            # Another request stored the same address first
+            db.rollback()
+
+    async def _request(self, address: str):
+        self.counters["geocoder_requests"] += 1
+        return await self.get_geocoder().geocode(address)
+
+    # Returns (latitude, longitude) for the address, or None when it cannot be located
+    async def geocode(self, db: Session, address: str):
+        key = normalize_address(address)
+        found, coords = self._recall(key)
+        if found:
+            return coords
+
+        row = db.query(GeocodedAddress).filter(GeocodedAddress.address == key).first()
+        if row is not None:
+            self.counters["table_hits"] += 1
+            coords = (row.latitude, row.longitude)
+            self._remember(key, coords)
+            return coords
+
+        pending = self.pending.setdefault(asyncio.get_running_loop(), {})
+        task = pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._request(address))
+            pending[key] = task
+            task.add_done_callback(lambda _: pending.pop(key, None))
+            coords = await asyncio.shield(task)
+
+            if coords is None:
+                self.counters["not_found"] += 1
+                self._remember(key, None, time.time() + self.miss_ttl)
+            else:
+                self._remember(key, coords)
+                self._store(db, key, coords)
+            return coords
+
+        return await asyncio.shield(task)
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, "memory_size": len(self.memory)}
+
+
+geocoding_service = GeocodingService(GEOCODE_CACHE_SIZE, GEOCODE_MISS_TTL)
+
+# Geocodes an address with caching and rate limiting; returns (latitude, longitude) or None
+async def geocode_address(db: Session, address: str):
+    return await geocoding_service.geocode(db, address)
+
+# Switches the geocoding backend at runtime, e.g. for load tests
+def set_geocoder_backend(backend: str, gazetteer_path: str = None):
+    geocoding_service.set_geocoder(make_geocoder(backend, gazetteer_path))
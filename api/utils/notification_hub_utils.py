@@ -0,0 +1,140 @@
+import os
+import asyncio
+import threading
+from dotenv import load_dotenv
+from fastapi import WebSocket, WebSocketDisconnect
+from database.database import SessionLocal
+from utils.broadcast_backend_utils import broadcast
+
+load_dotenv()
+
+# How many notifications a socket may have waiting before it is resynchronized from the database instead
+NOTIFICATION_QUEUE_SIZE = int(os.getenv('NOTIFICATION_QUEUE_SIZE', 100))
+# How many notifications a newly connected socket receives from its history
+NOTIFICATION_BACKFILL_LIMIT = int(os.getenv('NOTIFICATION_BACKFILL_LIMIT', 50))
+
+# One connected notification socket: the queue lives on the socket's event loop
+class NotificationSubscription:
+    def __init__(self, user_id: int, loop, queue_size: int):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+# Pushes new and changed notifications to the sockets of their user. Writers publish after committing, from any
+# thread (request handlers, background tasks, the dispatcher), through the broadcast backend so that the user's
+# sockets on every worker receive them; delivery is handed to each socket's event loop.
+class NotificationHub:
+    def __init__(self, queue_size: int, backend):
+        self.queue_size = queue_size
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        self.counters = {
+            "published": 0,
+            "delivered": 0,
+            "overflows": 0,
+        }
+
+    def subscribe(self, user_id: int) -> NotificationSubscription:
+        subscription = NotificationSubscription(user_id, asyncio.get_running_loop(), self.queue_size)
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: NotificationSubscription):
+        with self.lock:
+            subscriptions = self.subscribers.get(subscription.user_id)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscribers[subscription.user_id]
+
+    # Publishes a serialized notification to every socket of the user; safe to call from any thread
+    def publish(self, user_id: int, notification: dict):
+        with self.lock:
+            self.counters["published"] += 1
+        self.backend.publish("notifications", {"user_id": user_id, "notification": notification})
+
+    # Broadcast handler: hands a published notification to this process's sockets of the user
+    def receive(self, message: dict):
+        with self.lock:
+            subscriptions = list(self.subscribers.get(message["user_id"], ()))
+        notification = message["notification"]
+
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(self._deliver, subscription, notification)
+            except RuntimeError:
+                # The socket's event loop has already closed
+                pass
+
+    def _deliver(self, subscription: NotificationSubscription, notification: dict):
+        if subscription.queue.full():
+            subscription.overflowed = True
+            self.counters["overflows"] += 1
+            return
+        subscription.queue.put_nowait(notification)
+        self.counters["delivered"] += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.counters,
+                "users": len(self.subscribers),
+                "subscribers": sum(len(subscriptions) for subscriptions in self.subscribers.values()),
+            }
+
+
+notification_hub = NotificationHub(NOTIFICATION_QUEUE_SIZE, broadcast)
+broadcast.subscribe("notifications", notification_hub.receive)
+
+# Streams a user's notifications to the websocket: first a bounded backfill of what the client has not seen yet,
+# then every new or changed notification as it is published. load_backfill(db, user_id, after_id, limit) returns
+# serialized notifications, newest first; a socket that fell too far behind is backfilled again.
+async def stream_notifications(websocket: WebSocket, user_id: int, last_seen_id, load_backfill):
+    # Subscribes before loading the backfill, so nothing published in between is lost
+    subscription = notification_hub.subscribe(user_id)
+
+    def backfill(after_id):
+        db = SessionLocal()
+        try:
+            return load_backfill(db, user_id, after_id, NOTIFICATION_BACKFILL_LIMIT)
+        finally:
+            db.close()
+
+    async def send_notifications():
+        seen_id = last_seen_id
+        notifications = await asyncio.to_thread(backfill, seen_id)
+        while True:
+            await websocket.send_json({"type": "backfill", "notifications": notifications})
+            seen_id = max([seen_id or 0] + [notification["id"] for notification in notifications])
+
+            while not subscription.overflowed:
+                notification = await subscription.queue.get()
+                await websocket.send_json({"type": "delta", "notifications": [notification]})
+                seen_id = max(seen_id, notification["id"])
+
+            while not subscription.queue.empty():
+                subscription.queue.get_nowait()
+            subscription.overflowed = False
+            notifications = await asyncio.to_thread(backfill, seen_id)
+
+    async def wait_for_disconnect():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+    tasks = [asyncio.ensure_future(send_notifications()), asyncio.ensure_future(wait_for_disconnect())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                print(f"Error while streaming notifications to user {user_id}: {error}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        notification_hub.unsubscribe(subscription)
@@ -0,0 +1,59 @@
+import os
+import math
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EARTH_RADIUS_METERS = 6371000
+
+# Road distance is approximated as the straight-line distance times a detour factor,
+# and travel time from an average speed, both per vehicle profile
+OFFLINE_PROFILES = {
+    'car': {
+        'detour_factor': float(os.getenv('OFFLINE_DETOUR_FACTOR_CAR', 1.35)),
+        'speed_kmh': float(os.getenv('OFFLINE_SPEED_CAR_KMH', 30)),
+    },
+    'bike': {
+        'detour_factor': float(os.getenv('OFFLINE_DETOUR_FACTOR_BIKE', 1.25)),
+        'speed_kmh': float(os.getenv('OFFLINE_SPEED_BIKE_KMH', 15)),
+    },
+}
+
+# Calculates the great-circle distance in meters between two (latitude, longitude) coordinates
+def haversine_distance(start_coords, end_coords):
+    lat1, lon1 = math.radians(start_coords[0]), math.radians(start_coords[1])
+    lat2, lon2 = math.radians(end_coords[0]), math.radians(end_coords[1])
+
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(a))
+
+# Vectorized haversine_distance over paired lists of start and end coordinates, returning an array of meters
+def haversine_distances(start_coords, end_coords):
+    start = np.radians(np.asarray(start_coords, dtype=float).reshape(-1, 2))
+    end = np.radians(np.asarray(end_coords, dtype=float).reshape(-1, 2))
+
+    a = (
+        np.sin((end[:, 0] - start[:, 0]) / 2) ** 2
+        + np.cos(start[:, 0]) * np.cos(end[:, 0]) * np.sin((end[:, 1] - start[:, 1]) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+# Estimates the route between two coordinates without any network call, returning (distance in meters, travel time in minutes)
+def calculate_offline_route(start_coords, end_coords, vehicle_type):
+    profile = OFFLINE_PROFILES['car' if vehicle_type == 'car' else 'bike']
+
+    distance_in_meters = haversine_distance(start_coords, end_coords) * profile['detour_factor']
+    travel_time_minutes = distance_in_meters / (profile['speed_kmh'] * 1000 / 60)
+
+    return (distance_in_meters, travel_time_minutes)
+
+# Estimates the routes of many (start, end) pairs, matching the shape of async_calculate_route_matrix
+def calculate_offline_route_matrix(pairs, vehicle_type):
+    return [
+        calculate_offline_route(start_coords, end_coords, vehicle_type)
+        for start_coords, end_coords in pairs
+    ]
@@ -0,0 +1,186 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ROUTE_CACHE_SIZE = int(os.getenv('ROUTE_CACHE_SIZE', 10000))
+ROUTE_CACHE_TTL = int(os.getenv('ROUTE_CACHE_TTL', 7 * 24 * 60 * 60))
+ROUTE_CACHE_GRID = float(os.getenv('ROUTE_CACHE_GRID', 0.0005))
+ROUTE_CACHE_PATH = os.getenv('ROUTE_CACHE_PATH', 'route_cache.sqlite3')
+
+# Caches (distance in meters, travel time in minutes) per profile and grid-snapped coordinates,
+# in an in-process LRU backed by an SQLite file that survives restarts
+class RouteCache:
+    def __init__(self, max_size: int, ttl: int, grid: float, path: str):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.grid = grid
+        self.path = path
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.connection = None
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "expired": 0,
+        }
+
+    # Snaps a coordinate to the grid so nearby points share one cache entry
+    def snap(self, coords):
+        return (round(coords[0] / self.grid), round(coords[1] / self.grid))
+
+    def make_key(self, profile: str, start_coords, end_coords):
+        return (profile,) + self.snap(start_coords) + self.snap(end_coords)
+
+    # Opens the SQLite tier on first use; an empty path keeps the cache in memory only
+    def _get_connection(self):
+        if not self.path:
+            return None
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS route_cache (
+                    profile TEXT NOT NULL,
+                    start_lat INTEGER NOT NULL,
+                    start_lon INTEGER NOT NULL,
+                    end_lat INTEGER NOT NULL,
+                    end_lon INTEGER NOT NULL,
+                    distance REAL NOT NULL,
+                    duration REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (profile, start_lat, start_lon, end_lat, end_lon)
+                )
+                """
+            )
+            self.connection.commit()
+        return self.connection
+
+    def _remember(self, key, route, expires_at):
+        self.memory[key] = (route, expires_at)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    # Returns the cached (distance, duration) for the route or None on a miss
+    def get(self, profile: str, start_coords, end_coords):
+        key = self.make_key(profile, start_coords, end_coords)
+        now = time.time()
+
+        with self.lock:
+            cached = self.memory.get(key)
+            if cached is not None:
+                route, expires_at = cached
+                if expires_at > now:
+                    self.memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return route
+                del self.memory[key]
+                self.counters["expired"] += 1
+
+            connection = self._get_connection()
+            if connection is not None:
+                row = connection.execute(
+                    "SELECT distance, duration, expires_at FROM route_cache "
+                    "WHERE profile = ? AND start_lat = ? AND start_lon = ? AND end_lat = ? AND end_lon = ?",
+                    key,
+                ).fetchone()
+                if row is not None:
+                    distance, duration, expires_at = row
+                    if expires_at > now:
+                        route = (distance, duration)
+                        self._remember(key, route, expires_at)
+                        self.counters["disk_hits"] += 1
+                        return route
+                    connection.execute(
+                        "DELETE FROM route_cache "
+                        "WHERE profile = ? AND start_lat = ? AND start_lon = ? AND end_lat = ? AND end_lon = ?",
+                        key,
+                    )
+                    connection.commit()
+                    self.counters["expired"] += 1
+
+            self.counters["misses"] += 1
+            return None
+
+    # Stores (distance, duration) for the route in both tiers
+    def set(self, profile: str, start_coords, end_coords, route):
+        key = self.make_key(profile, start_coords, end_coords)
+        expires_at = time.time() + self.ttl
+
+        with self.lock:
+            self._remember(key, route, expires_at)
+
+            connection = self._get_connection()
+            if connection is not None:
+                connection.execute(
+                    "INSERT OR REPLACE INTO route_cache "
+                    "(profile, start_lat, start_lon, end_lat, end_lon, distance, duration, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    key + (route[0], route[1], expires_at),
+                )
+                connection.commit()
+
+    # Stores many (profile, start_coords, end_coords, route) entries in both tiers with a single disk commit
+    def set_many(self, entries):
+        expires_at = time.time() + self.ttl
+        rows = []
+
+        with self.lock:
+            for profile, start_coords, end_coords, route in entries:
+                key = self.make_key(profile, start_coords, end_coords)
+                self._remember(key, route, expires_at)
+                rows.append(key + (route[0], route[1], expires_at))
+
+            connection = self._get_connection()
+            if connection is not None and rows:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO route_cache "
+                    "(profile, start_lat, start_lon, end_lat, end_lon, distance, duration, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                connection.commit()
+
+    # Drops expired entries from both tiers and returns how many disk rows were removed
+    def purge_expired(self):
+        now = time.time()
+        with self.lock:
+            for key in [key for key, (_, expires_at) in self.memory.items() if expires_at <= now]:
+                del self.memory[key]
+
+            connection = self._get_connection()
+            if connection is None:
+                return 0
+            removed = connection.execute(
+                "DELETE FROM route_cache WHERE expires_at <= ?", (now,)
+            ).rowcount
+            connection.commit()
+            return removed
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            connection = self._get_connection()
+            if connection is not None:
+                connection.execute("DELETE FROM route_cache")
+                connection.commit()
+
+    # Returns hit/miss counters and the current size of the memory tier
+    def stats(self):
+        with self.lock:
+            lookups = sum(self.counters.values()) - self.counters["expired"]
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            return {
+                **self.counters,
+                "memory_size": len(self.memory),
+                "hit_rate": hits / lookups if lookups else 0,
+            }
+
+
+route_cache = RouteCache(ROUTE_CACHE_SIZE, ROUTE_CACHE_TTL, ROUTE_CACHE_GRID, ROUTE_CACHE_PATH)
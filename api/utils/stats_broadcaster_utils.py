@@ -0,0 +1,176 @@
+import os
+import time
+import asyncio
+from dotenv import load_dotenv
+from fastapi import WebSocket, WebSocketDisconnect
+from database.database import SessionLocal
+from utils.broadcast_backend_utils import broadcast
+
+load_dotenv()
+
+STATS_INTERVAL_SECONDS = float(os.getenv('STATS_INTERVAL_SECONDS', 5))
+
+# Computes statistics snapshots once per interval for every subscribed key (e.g. an owner ID) and fans each one out
+# to that key's subscribers, instead of every dashboard socket running its own queries on its own session.
+# compute(db, keys) returns {key: snapshot} for all keys in one go; it runs off the event loop with a short-lived
+# session, and a snapshot equal to the key's previous one is not sent again.
+# Across workers, each one with subscribers announces its keys through the broadcast backend every interval; only
+# the worker leading the broadcaster computes, for the keys announced lately, and publishes one message per snapshot
+# that every worker fans out to its own subscribers.
+class KeyedStatsBroadcaster:
+    def __init__(self, name: str, compute, interval: float, backend=broadcast):
+        self.name = name
+        self.compute = compute
+        self.interval = interval
+        self.backend = backend
+        self.subscribers = {}
+        self.snapshots = {}
+        self.interests = {}
+        self.loop = None
+        self.task = None
+        self.counters = {
+            "computed": 0,
+            "sent": 0,
+            "unchanged": 0,
+            "errors": 0,
+        }
+        backend.subscribe(self.channel, self.receive)
+
+    @property
+    def channel(self) -> str:
+        return f"stats:{self.name}"
+
+    # Registers a subscriber for the key and returns the queue its snapshots arrive on. The queue only ever holds
+    # the latest snapshot, so a slow socket skips stale ones instead of piling them up.
+    def subscribe(self, key=None) -> asyncio.Queue:
+        self.loop = asyncio.get_running_loop()
+        subscriber = asyncio.Queue(maxsize=1)
+        self.subscribers.setdefault(key, set()).add(subscriber)
+        if key in self.snapshots:
+            subscriber.put_nowait(self.snapshots[key])
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber: asyncio.Queue, key=None):
+        subscribers = self.subscribers.get(key)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            # Nobody is watching the key, so its next subscriber starts from a fresh snapshot
+            del self.subscribers[key]
+            self.snapshots.pop(key, None)
+
+    def _compute_snapshots(self, keys):
+        db = SessionLocal()
+        try:
+            return self.compute(db, keys)
+        finally:
+            db.close()
+
+    def _publish(self, key, snapshot):
+        subscribers = self.subscribers.get(key, ())
+        self.counters["sent"] += len(subscribers)
+        for subscriber in subscribers:
+            if subscriber.full():
+                subscriber.get_nowait()
+            subscriber.put_nowait(snapshot)
+
+    # Broadcast handler; runs on the backend's thread, so the message is handed to the subscribers' event loop
+    def receive(self, message: dict):
+        if self.loop is None:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._handle, message)
+        except RuntimeError:
+            # The subscribers' event loop has already closed
+            pass
+
+    def _handle(self, message: dict):
+        if message["type"] == "interest":
+            now = time.monotonic()
+            for key in message["keys"]:
+                self.interests[key] = now
+            return
+
+        key, snapshot = message["key"], message["snapshot"]
+        if key not in self.subscribers:
+            return
+        if self.snapshots.get(key) == snapshot:
+            self.counters["unchanged"] += 1
+            return
+        self.snapshots[key] = snapshot
+        self._publish(key, snapshot)
+
+    # Keys subscribed on this worker, plus those other workers announced within the last two intervals
+    def _wanted_keys(self):
+        expired = time.monotonic() - 2 * self.interval
+        for key in [key for key, seen in self.interests.items() if seen < expired]:
+            del self.interests[key]
+        return set(self.subscribers) | set(self.interests)
+
+    # One producer round, off the event loop: announces this worker's keys and, when leading, computes and publishes
+    # the snapshots of every wanted key
+    def _produce(self, keys, wanted_keys):
+        self.backend.publish(self.channel, {"type": "interest", "keys": keys})
+        if not self.backend.try_lead(self.name):
+            return
+        snapshots = self._compute_snapshots(wanted_keys)
+        self.counters["computed"] += 1
+        for key, snapshot in snapshots.items():
+            self.backend.publish(self.channel, {"type": "snapshot", "key": key, "snapshot": snapshot})
+
+    # Producer loop; runs while anyone is subscribed and stops with the last subscriber
+    async def _run(self):
+        try:
+            while self.subscribers:
+                try:
+                    await asyncio.to_thread(self._produce, list(self.subscribers), list(self._wanted_keys()))
+                except Exception as e:
+                    self.counters["errors"] += 1
+                    print(f"Error while computing {self.name} statistics: {e}")
+                await asyncio.sleep(self.interval)
+        finally:
+            # Another worker with subscribers takes over on its next interval
+            self.backend.resign(self.name)
+
+    def stats(self):
+        return {
+            **self.counters,
+            "keys": len(self.subscribers),
+            "subscribers": sum(len(subscribers) for subscribers in self.subscribers.values()),
+            "announced_keys": len(self.interests),
+        }
+
+# Broadcaster for statistics shared by every subscriber, such as the admin dashboard; compute(db) returns the snapshot
+class StatsBroadcaster(KeyedStatsBroadcaster):
+    def __init__(self, name: str, compute, interval: float, backend=broadcast):
+        super().__init__(name, lambda db, keys: {None: compute(db)}, interval, backend)
+
+# Sends a subscriber's snapshots to its websocket until the client disconnects. Incoming frames are read only to
+# notice the disconnect while no snapshot is due.
+async def stream_snapshots(websocket: WebSocket, broadcaster: KeyedStatsBroadcaster, key=None):
+    subscriber = broadcaster.subscribe(key)
+
+    async def send_snapshots():
+        while True:
+            await websocket.send_json(await subscriber.get())
+
+    async def wait_for_disconnect():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+    tasks = [asyncio.ensure_future(send_snapshots()), asyncio.ensure_future(wait_for_disconnect())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                print(f"Error while streaming {broadcaster.name} statistics: {error}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        broadcaster.unsubscribe(subscriber, key)
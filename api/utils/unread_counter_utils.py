@@ -0,0 +1,168 @@
+import asyncio
+import threading
+from sqlalchemy import func
+from fastapi import WebSocket, WebSocketDisconnect
+from database.database import SessionLocal
+from models.models import Chat
+from utils.broadcast_backend_utils import broadcast
+
+# Per-user counts of unread chat messages, kept in memory so /ws/messages never queries the chats table.
+# The counters are seeded from one grouped query and then adjusted by every write that creates or reads messages,
+# after it committed. Changes travel through the broadcast backend, so every worker's counters follow writes made
+# on any of them; a change is pushed to the user's sockets, on their own event loops, only when it happens.
+class UnreadCounters:
+    def __init__(self, backend):
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.seed_lock = threading.Lock()
+        self.counts = {}
+        self.seeded = False
+        self.subscribers = {}
+        self.counters = {
+            "seeds": 0,
+            "changes": 0,
+            "pushed": 0,
+        }
+
+    # Loads every user's unread count in one grouped query
+    def seed(self, db=None):
+        close = db is None
+        db = db or SessionLocal()
+        try:
+            rows = (
+                db.query(Chat.receiver_id, func.count(Chat.id))
+                .filter(Chat.is_seen == False)
+                .group_by(Chat.receiver_id)
+                .all()
+            )
+        finally:
+            if close:
+                db.close()
+
+        with self.lock:
+            self.counts = dict(rows)
+            self.seeded = True
+            self.counters["seeds"] += 1
+            subscribed = list(self.subscribers)
+        for user_id in subscribed:
+            self._push(user_id)
+
+    # Seeds the counters when nothing has yet; runs a query, so call it off the event loop
+    def ensure_seeded(self):
+        with self.seed_lock:
+            if not self.seeded:
+                self.seed()
+
+    def get(self, user_id: int) -> int:
+        self.ensure_seeded()
+        with self.lock:
+            return self.counts.get(user_id, 0)
+
+    # Records committed changes of unread counts as {user_id: delta}
+    def apply(self, deltas: dict):
+        deltas = [[user_id, delta] for user_id, delta in deltas.items() if delta]
+        if deltas:
+            self.backend.publish("unread", {"deltas": deltas})
+
+    # Broadcast handler: applies changes published by any worker to this process's counters. Before the first
+    # socket seeded them there is nothing to adjust; the seed reads the committed counts, changes included.
+    def receive(self, message: dict):
+        changed = []
+        with self.lock:
+            if not self.seeded:
+                return
+            for user_id, delta in message["deltas"]:
+                if not delta:
+                    continue
+                self.counts[user_id] = max(self.counts.get(user_id, 0) + delta, 0)
+                self.counters["changes"] += 1
+                changed.append(user_id)
+        for user_id in changed:
+            self._push(user_id)
+
+    def message_created(self, receiver_id: int, count: int = 1):
+        self.apply({receiver_id: count})
+
+    def messages_read(self, receiver_id: int, count: int):
+        self.apply({receiver_id: -count})
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=1))
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(subscriber)
+        self._push(user_id)
+        return subscriber[1]
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        with self.lock:
+            subscribers = self.subscribers.get(user_id, set())
+            for subscriber in [subscriber for subscriber in subscribers if subscriber[1] is queue]:
+                subscribers.discard(subscriber)
+            if not subscribers:
+                self.subscribers.pop(user_id, None)
+
+    # Hands the user's current count to each of their sockets; safe to call from any thread
+    def _push(self, user_id: int):
+        with self.lock:
+            if not self.seeded:
+                return
+            count = self.counts.get(user_id, 0)
+            subscribers = list(self.subscribers.get(user_id, ()))
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, count)
+            except RuntimeError:
+                # The socket's event loop has already closed
+                pass
+
+    def _deliver(self, queue: asyncio.Queue, count: int):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(count)
+        self.counters["pushed"] += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.counters,
+                "users": len(self.counts),
+                "subscribers": sum(len(subscribers) for subscribers in self.subscribers.values()),
+            }
+
+
+unread_counters = UnreadCounters(broadcast)
+broadcast.subscribe("unread", unread_counters.receive)
+
+# Sends the user's unread message count to the websocket whenever it changes, until the client disconnects
+async def stream_unread_count(websocket: WebSocket, user_id: int):
+    # The first socket seeds the counters off the event loop
+    if not unread_counters.seeded:
+        await asyncio.to_thread(unread_counters.ensure_seeded)
+    queue = unread_counters.subscribe(user_id)
+
+    async def send_counts():
+        last_sent = None
+        while True:
+            count = await queue.get()
+            if count != last_sent:
+                await websocket.send_json({"unread_count": count})
+                last_sent = count
+
+    async def wait_for_disconnect():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+    tasks = [asyncio.ensure_future(send_counts()), asyncio.ensure_future(wait_for_disconnect())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                print(f"Error while streaming the unread count of user {user_id}: {error}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        unread_counters.unsubscribe(user_id, queue)
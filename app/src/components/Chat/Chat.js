@@ -91,6 +91,11 @@ function Chat({ userType }) {
 
       chatSocketRef.current.onmessage = (event) => {
         const data = JSON.parse(event.data);
+        // The server drops chat sockets that stop answering its heartbeats
+        if (data.type === "ping") {
+          event.target.send(JSON.stringify({ type: "pong" }));
+          return;
+        }
         setMessages((prevMessages) => [...prevMessages, data]);
       };
     }
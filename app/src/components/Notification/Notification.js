@@ -47,14 +47,22 @@ function Notification() {
       };
     };
 
+    // The server sends a backfill of recent notifications, then only new or changed ones, merged here by id
     ws.onmessage = (event) => {
       const data = JSON.parse(event.data);
-      setNotifications(data.notifications);
-      const unreadNotifications = data.notifications.filter(
-        (notification) => !notification.read
-      );
-      setUnreadCount(unreadNotifications.length);
-      setHasUnread(unreadNotifications.length > 0);
+      setNotifications((prevNotifications) => {
+        const merged = new Map(prevNotifications.map((n) => [n.id, n]));
+        data.notifications.forEach((n) => merged.set(n.id, n));
+        const updatedNotifications = Array.from(merged.values()).sort((a, b) => b.id - a.id);
+
+        const unreadNotifications = updatedNotifications.filter(
+          (notification) => !notification.read
+        );
+        setUnreadCount(unreadNotifications.length);
+        setHasUnread(unreadNotifications.length > 0);
+
+        return updatedNotifications;
+      });
     };
 
     return () => {